@@ -0,0 +1,192 @@
+# Advanced Robotics
+#
+# Corrects translated words using a list of known words. Instead of picking the closest letter for every group of dots and dashes on its own,
+# each letter gets a score for every letter it could be, and a beam search finds the known words that best fit the scores. Only the best few
+# partial words (the beam) are kept after each letter, and a partial word is dropped as soon as no known word starts with it, so the search
+# stays fast enough to run on every word as it is received.
+#
+# Running this file checks that clearly received words are never changed and that noisy ones are corrected.
+#
+# Usage: python beamSearch.py
+
+import math
+import sys
+
+from robotDemo import classify_light_runs, encode_text, get_light_runs, morse_code
+
+# Lowest chance a single dot or dash is given, when it was received as the other kind with full confidence, and the score that gives
+min_chance = 1e-9
+mark_floor = math.log(min_chance)
+
+# How much worse than the best letter-by-letter translation a known word can score and still be used instead of it. This is less than what
+# one dot or dash received with full confidence costs, so a letter that was received clearly is never replaced.
+max_word_penalty = -mark_floor / 2
+
+
+def build_word_trie(words):
+    """
+    Builds a prefix tree out of a list of words, in the same form as build_morse_tree in robotDemo.py. Each node is a list [word, children]
+    where word is the word that ends at that node (or None if no word does) and children is a dictionary from the next letter to the next node.
+    Words are stored in upper case, like the letters in morse_code.
+    """
+    root = [None, {}]
+    for word in words:
+        word = word.upper()
+        node = root
+        for letter in word:
+            node = node[1].setdefault(letter, [None, {}])
+        node[0] = word
+    return root
+
+
+def get_marks(code):
+    """
+    Returns just the dots and dashes of a letter's morse code list, so [1, 0, 3] becomes [1, 3].
+    """
+    return [length for length in code if length != 0]
+
+
+def score_letter(marks):
+    """
+    Given a list of (kind, confidence) pairs for the dots and dashes of one received letter, returns a dictionary from every letter in
+    morse_code to the log of how likely it is to be that letter. A dot with confidence c is a dot with a chance of (1 + c) / 2 and a dash
+    otherwise, and no mark scores less than mark_floor. Letters with a different number of dots and dashes score one mark_floor lower than a
+    letter of the right length with every mark wrong, so they are always the worst choice.
+    """
+    miss_score = mark_floor * (len(marks) + 1)
+
+    scores = {}
+    for letter, code in morse_code.items():
+        letter_marks = get_marks(code)
+        if len(letter_marks) != len(marks):
+            scores[letter] = miss_score
+            continue
+
+        score = 0
+        for (kind, confidence), length in zip(marks, letter_marks):
+            same_chance = (1 + confidence) / 2
+            if (kind == "dot") == (length == 1):
+                score += math.log(max(same_chance, min_chance))
+            else:
+                score += math.log(max(1 - same_chance, min_chance))
+        scores[letter] = score
+    return scores
+
+
+def get_letter_scores(light_runs, unit=1):
+    """
+    Splits a list of (light_on, duration) pairs into words and letters using classify_light_runs, and returns a list of words where each word is
+    a list of letter score dictionaries from score_letter.
+    """
+    words = []
+    letters = []
+    marks = []
+
+    for kind, confidence in classify_light_runs(light_runs, unit):
+        if kind == "dot" or kind == "dash":
+            marks.append((kind, confidence))
+        elif kind != "space":
+            if marks:
+                letters.append(score_letter(marks))
+                marks = []
+            if kind == "word" and letters:
+                words.append(letters)
+                letters = []
+
+    if marks:
+        letters.append(score_letter(marks))
+    if letters:
+        words.append(letters)
+    return words
+
+
+def beam_search(letter_scores, trie, beam_width=8, top_k=3):
+    """
+    Finds the known words in trie that best fit a list of letter score dictionaries. After each letter only the beam_width best partial words
+    are kept, and partial words that no known word starts with are dropped. Returns up to top_k (word, score) pairs, best first.
+    """
+    beam = [(0, trie)]     # (score, node) pairs for each partial word
+
+    for scores in letter_scores:
+        next_beam = []
+        for score, node in beam:
+            for letter, child in node[1].items():
+                next_beam.append((score + scores.get(letter, min(scores.values())), child))
+
+        next_beam.sort(key=lambda item: item[0], reverse=True)
+        beam = next_beam[:beam_width]
+        if not beam:
+            return []
+
+    words = [(node[0], score) for score, node in beam if node[0] is not None]
+    return words[:top_k]
+
+
+def translate_with_words(morse_lengths, trie, beam_width=8):
+    """
+    Translates a morse code lengths list (ex. [3, 0, 0, 0, 1]) like translate_morse_code with tolerant=True, but replaces each word with the
+    known word from trie (made by build_word_trie) that fits it best. Each word is first translated one letter at a time by picking the best
+    letter for each position, skipping letters that don't match anything. The known word is only used if its score is no more than
+    max_word_penalty worse than that, so a word that isn't in the list isn't forced into one that is, and a word that was received clearly
+    always comes back unchanged.
+    """
+    translated = []
+    for word_scores in get_letter_scores(get_light_runs(morse_lengths)):
+        word = ""
+        word_score = 0
+        for scores in word_scores:
+            # If every letter scores the same, none of them has the right number of dots and dashes
+            letter = max(scores, key=scores.get)
+            if scores[letter] > min(scores.values()):
+                word += letter
+                word_score += scores[letter]
+
+        matches = beam_search(word_scores, trie, beam_width, top_k=1)
+        if matches and matches[0][1] >= word_score - max_word_penalty:
+            word = matches[0][0]
+
+        if word:
+            translated.append(word)
+
+    return " ".join(translated)
+
+
+def check_words():
+    """
+    Translates a few messages with translate_with_words and returns a list of (message, words, expected, translated) tuples for every one
+    that wasn't translated as expected. Words that were received clearly have to come back exactly as they were sent, even if they aren't in
+    the word list and a word in the list is only one letter different.
+    """
+    checks = [
+        ("HOT", ["HAT", "HIT"], "HOT"),
+        ("TAT", ["HAT", "HIT"], "TAT"),
+        ("CET", ["CAT"], "CET"),
+        ("XYZ SOS", ["SOS", "HELLO"], "XYZ SOS"),
+        ("HELLO WORLD", ["HELLO", "WORLD"], "HELLO WORLD"),
+    ]
+
+    # "HELLO WORLD" with some dashes received too short and some dots too long, so each is halfway between a dot and a dash
+    noisy = []
+    for i, length in enumerate(encode_text("HELLO WORLD")):
+        noisy.append(2 if (length == 3 and i % 2 == 0) or (length == 1 and i % 5 == 0) else length)
+
+    failures = []
+    for message, words, expected in checks:
+        translated = translate_with_words(encode_text(message), build_word_trie(words))
+        if translated != expected:
+            failures.append((message, words, expected, translated))
+
+    translated = translate_with_words(noisy, build_word_trie(["HELLO", "HELP", "WORLD", "WORD"]))
+    if translated != "HELLO WORLD":
+        failures.append(("noisy HELLO WORLD", ["HELLO", "HELP", "WORLD", "WORD"], "HELLO WORLD", translated))
+
+    return failures
+
+
+if __name__ == "__main__":
+    failures = check_words()
+
+    for message, words, expected, translated in failures:
+        print("%s with %r: expected %r, got %r" % (message, words, expected, translated))
+    print("%d checks failed" % len(failures))
+    sys.exit(1 if failures else 0)
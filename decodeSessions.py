@@ -0,0 +1,107 @@
+# Advanced Robotics
+#
+# Translates a directory of recorded morse code sessions on a computer, using every core. Each session is either a JSON file with the ambient
+# light readings and the calibration values from the robot, like {"min_light": 5, "max_light": 90, "readings": [90, 5, 90, 90, 90]}, or a
+# .trace file written by lightTrace.py. Sessions are translated with the same functions the robot uses, and each translation is printed as soon
+# as its session is finished. Sessions that can't be read are reported and skipped.
+#
+# Usage: python decodeSessions.py SESSION_DIRECTORY [--workers N]
+
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+from lightTrace import open_trace
+from robotDemo import classify_readings, get_morse_lengths, trim_morse_list, translate_morse_code
+
+
+def load_session(path):
+    """
+    Returns the (readings, min_light, max_light) of the session file at path.
+    """
+    with open(path) as session_file:
+        session = json.load(session_file)
+    return (session["readings"], session["min_light"], session["max_light"])
+
+
+def translate_readings(readings, min_light, max_light):
+    """
+    Translates readings the same way the robot translates readings from read_morse_with_pauses.
+    """
+    light_states = classify_readings(readings, min_light, max_light)
+    morse_lengths = trim_morse_list(list(get_morse_lengths(light_states)))
+
+    return translate_morse_code(morse_lengths)
+
+
+def decode_session(path):
+    """
+    Translates the session file at path. Returns a (path, number of readings, message, error) tuple. If the session can't be read or
+    translated, the number of readings is 0, the message is None, and error says what went wrong, so one bad file doesn't stop the others.
+    Otherwise error is None.
+    """
+    try:
+        # Trace files are translated straight from the memory mapped file
+        if path.endswith(".trace"):
+            with open_trace(path) as trace:
+                return (path, len(trace.samples), translate_readings(trace.samples, trace.min_light, trace.max_light), None)
+
+        readings, min_light, max_light = load_session(path)
+        return (path, len(readings), translate_readings(readings, min_light, max_light), None)
+    except Exception as error:
+        return (path, 0, None, "%s: %s" % (type(error).__name__, error))
+
+
+def find_sessions(directory):
+    """
+    Returns the paths of all session files in directory, in order by name.
+    """
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".json") or name.endswith(".trace"))
+    return [os.path.join(directory, name) for name in names]
+
+
+def decode_sessions(paths, workers=None):
+    """
+    Translates the session files in paths using a pool of workers processes (one per core by default). Yields a
+    (path, number of readings, message, error) tuple from decode_session for each session as soon as it is finished, so they may not be in the
+    same order as paths.
+    """
+    with Pool(workers) as pool:
+        for result in pool.imap_unordered(decode_session, paths):
+            yield result
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Translate a directory of recorded morse code sessions.")
+    parser.add_argument("directory", help="directory of session files")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per core)")
+    args = parser.parse_args(args)
+
+    paths = find_sessions(args.directory)
+
+    start = time.perf_counter()
+    total_readings = 0
+    failed = 0
+
+    for path, num_readings, message, error in decode_sessions(paths, args.workers):
+        if error is not None:
+            failed += 1
+            print("%s: could not be translated (%s)" % (os.path.basename(path), error), file=sys.stderr, flush=True)
+            continue
+
+        total_readings += num_readings
+        print("%s: %s" % (os.path.basename(path), message), flush=True)
+
+    elapsed = time.perf_counter() - start
+    rate = total_readings / elapsed if elapsed > 0 else 0
+    print("Translated %d sessions (%d readings, %d failed) in %.2f seconds, %.0f readings/sec"
+          % (len(paths) - failed, total_readings, failed, elapsed, rate), file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# Advanced Robotics
+#
+# A compact file format for recorded ambient light readings. Readings from get_ambient_light() are always 0-100, so each one is stored as a
+# single byte after a 16 byte header:
+#
+#     magic      4 bytes   b"LTRC"
+#     version    1 byte    1
+#     sensor     1 byte    port of the color sensor the readings came from, like b"A"
+#     rate       4 bytes   readings per second as a float, 0 if readings were taken on button presses
+#     min_light  1 byte    calibrated light level when the light is off
+#     max_light  1 byte    calibrated light level when the light is on
+#     count      4 bytes   number of readings
+#
+# Trace files are read with a memory map, so opening one doesn't read the readings into memory and the decoders get them without any copying.
+
+import mmap
+import os
+import struct
+
+header_format = "<4sBcfBBI"
+header_size = struct.calcsize(header_format)
+magic = b"LTRC"
+version = 1
+
+
+def write_trace(path, readings, sample_rate, min_light, max_light, sensor="A"):
+    """
+    Writes readings to a trace file at path along with the sample rate, calibration values, and sensor port they were recorded with.
+    """
+    readings = bytes(bytearray(readings))
+    header = struct.pack(header_format, magic, version, sensor.encode(), sample_rate, min_light, max_light, len(readings))
+
+    with open(path, "wb") as trace_file:
+        trace_file.write(header)
+        trace_file.write(readings)
+
+
+class LightTrace:
+    """
+    A trace file opened with open_trace. The header values are in sensor, sample_rate, min_light, and max_light, and the readings are in samples
+    as a memoryview of the file that can be used like a list of ints or passed to numpy.frombuffer without copying. Any arrays made from samples
+    have to be deleted before the trace is closed.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as trace_file:
+            # An empty file can't be memory mapped, so check the size before mapping it
+            if os.fstat(trace_file.fileno()).st_size < header_size:
+                raise ValueError("%s is too short to be a trace file" % path)
+            self.map = mmap.mmap(trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        file_magic, file_version, sensor, sample_rate, min_light, max_light, count = struct.unpack_from(header_format, self.map)
+        if file_magic != magic or file_version != version:
+            self.map.close()
+            raise ValueError("%s is not a version %d trace file" % (path, version))
+        if len(self.map) < header_size + count:
+            self.map.close()
+            raise ValueError("%s is missing readings" % path)
+
+        self.sensor = sensor.decode()
+        self.sample_rate = sample_rate
+        self.min_light = min_light
+        self.max_light = max_light
+        self.samples = memoryview(self.map)[header_size:header_size + count]
+
+    def close(self):
+        self.samples.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_trace(path):
+    """
+    Opens the trace file at path. The trace should be closed when it is no longer needed, or used in a with statement.
+    """
+    return LightTrace(path)
@@ -0,0 +1,175 @@
+# Advanced Robotics
+#
+# Translates recorded ambient light readings into text on a computer. This does the same thing as read_morse_with_pauses followed by
+# translate_morse_code in robotDemo.py, but works on a whole NumPy array of readings at once instead of one reading at a time, so traces with
+# millions of readings can be translated quickly. NumPy isn't available on the hub, so this file is only meant to be used on a computer.
+#
+# Running this file checks that decode_trace gives the same translation as the robot for a number of random traces.
+#
+# Usage: python morseBatch.py [NUM_TRACES]
+
+import random
+import sys
+
+import numpy as np
+
+from robotDemo import classify_readings, get_morse_lengths, letter_gap, morse_code, translate_morse_code, trim_morse_list, word_gap
+
+
+def pack_code(code):
+    """
+    Packs a letter's morse code list (ex. [1, 0, 3]) into a single number. Each dot is a 0 bit and each dash is a 1 bit, in order, with an
+    extra 1 bit in front so codes of different lengths can't have the same number. [1, 0, 3] packs into 0b101 = 5.
+    """
+    packed = 1
+    for length in code:
+        if length != 0:
+            packed = packed * 2 + (1 if length == 3 else 0)
+    return packed
+
+
+def build_lookup_table(code_table):
+    """
+    Builds an array that maps each packed code to its letter, or "" if no letter has that code.
+    """
+    longest = max(len([length for length in code if length != 0]) for code in code_table.values())
+    table = np.full(2 ** (longest + 1), "", dtype="U1")
+    for letter, code in code_table.items():
+        table[pack_code(code)] = letter
+    return table
+
+
+# Packed code lookup table of the morse_code dictionary
+lookup_table = build_lookup_table(morse_code)
+
+
+def classify_trace(readings, min_light, max_light):
+    """
+    Returns a boolean array that is True for each reading where the light is on. Like classify_readings in robotDemo.py, a reading is on if it
+    is closer to max_light than min_light.
+    """
+    # Readings are compared as floats so readings that aren't whole numbers, like fused or rescaled ones, aren't rounded first
+    readings = np.asarray(readings, dtype=np.float64)
+    return np.abs(readings - max_light) < np.abs(readings - min_light)
+
+
+def get_runs(light_states):
+    """
+    Splits a boolean array of light states into runs of the same state. Returns an array of whether each run is on and an array of how many
+    readings each run lasts.
+    """
+    light_states = np.asarray(light_states, dtype=bool)
+    if light_states.size == 0:
+        return np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64)
+
+    # A run starts at the first reading and at every reading that is different from the one before it
+    starts = np.concatenate(([0], np.flatnonzero(light_states[1:] != light_states[:-1]) + 1))
+    lengths = np.diff(np.concatenate((starts, [light_states.size])))
+    return light_states[starts], lengths
+
+
+def trace_to_morse_lengths(readings, min_light, max_light):
+    """
+    Returns the morse code lengths for an array of readings in the same form as read_morse_with_pauses, with trailing 0's removed. Each run of
+    readings where the light is on becomes its length, and each reading where the light is off becomes a 0.
+    """
+    runs_on, run_lengths = get_runs(classify_trace(readings, min_light, max_light))
+
+    values = np.where(runs_on, run_lengths, 0)
+    counts = np.where(runs_on, 1, run_lengths)
+    return np.trim_zeros(np.repeat(values, counts), "b")
+
+
+def decode_trace(readings, min_light, max_light):
+    """
+    Translates an array of readings into text, giving the same result as translating the output of read_morse_with_pauses with
+    translate_morse_code. The on/off runs are grouped into letters wherever the light is off for three or more readings and into words wherever
+    it is off for seven or more, each letter's dots and dashes are packed into a number, and the numbers are looked up in the packed code table,
+    all without looping over the readings in Python.
+    """
+    runs_on, run_lengths = get_runs(classify_trace(readings, min_light, max_light))
+
+    mark_indexes = np.flatnonzero(runs_on)     # Index of each run where the light is on, these are the dots and dashes
+    if mark_indexes.size == 0:
+        return ""
+    mark_lengths = run_lengths[mark_indexes]
+
+    # How long the light is off after each dot/dash. A run where the light is on is always followed by one where it is off, except at the end.
+    next_indexes = np.minimum(mark_indexes + 1, run_lengths.size - 1)
+    gap_lengths = np.where(mark_indexes + 1 < run_lengths.size, run_lengths[next_indexes], 0)
+
+    # A new letter starts at the first dot/dash and after every space of three or more readings
+    letter_starts = np.concatenate(([True], gap_lengths[:-1] >= letter_gap))
+    letter_ids = np.cumsum(letter_starts) - 1
+    num_letters = letter_ids[-1] + 1
+
+    # Position of each dot/dash in its letter, and how many dots/dashes each letter has
+    first_marks = np.flatnonzero(letter_starts)
+    positions = np.arange(mark_lengths.size) - first_marks[letter_ids]
+    letter_sizes = np.bincount(letter_ids, minlength=num_letters)
+
+    # Letters with a dot/dash that isn't exactly 1 or 3 long, or with more dots/dashes than any letter in the table, can't be translated
+    bad_marks = (mark_lengths != 1) & (mark_lengths != 3)
+    longest = int(np.log2(lookup_table.size)) - 1
+    valid = (np.bincount(letter_ids, weights=bad_marks, minlength=num_letters) == 0) & (letter_sizes <= longest)
+
+    # Pack each letter the same way as pack_code: dashes are 1 bits in order after a leading 1 bit
+    shifts = np.minimum(letter_sizes[letter_ids] - 1 - positions, longest)
+    bits = (mark_lengths == 3).astype(np.int64) << shifts
+    packed = np.bincount(letter_ids, weights=bits, minlength=num_letters).astype(np.int64)
+    packed += np.left_shift(1, np.minimum(letter_sizes, longest))
+
+    # A new word starts with the letter after every space of seven or more readings
+    word_ids = np.cumsum(np.concatenate(([False], gap_lengths[:-1] >= word_gap))[first_marks])
+
+    # Codes with the right shape that no letter has look up as "", and must not start a word either. The packed codes of letters that are
+    # already invalid can be past the end of the table, so they look up the unused code 0 instead.
+    valid &= lookup_table[np.where(valid, packed, 0)] != ""
+
+    # Put a space in front of the first translated letter of every word except the first, so words with no translated letters are skipped
+    letters = lookup_table[packed[valid]]
+    letter_words = word_ids[valid]
+    new_words = np.concatenate(([False], letter_words[1:] != letter_words[:-1]))
+    letters = np.where(new_words, np.char.add(" ", letters), letters)
+
+    return "".join(letters.tolist())
+
+
+def random_trace(rng, min_light=5, max_light=90):
+    """
+    Returns a random list of readings made of runs where the light is on for 1-4 readings and off for 1-9, so it has dots, dashes, letters,
+    and words along with marks and letters that can't be translated.
+    """
+    readings = [min_light] * rng.randint(0, 3)
+    for run in range(rng.randint(0, 40)):
+        readings.extend([max_light] * rng.randint(1, 4))
+        readings.extend([min_light] * rng.randint(1, 9))
+    return readings
+
+
+def check_against_robot(num_traces=30000, seed=0):
+    """
+    Translates num_traces random traces with both decode_trace and the robot's functions in robotDemo.py. Returns a list of
+    (readings, robot translation, decode_trace translation) tuples for every trace where they are different.
+    """
+    rng = random.Random(seed)
+    mismatches = []
+
+    for i in range(num_traces):
+        readings = random_trace(rng)
+        expected = translate_morse_code(trim_morse_list(list(get_morse_lengths(classify_readings(readings, 5, 90)))))
+        translated = decode_trace(readings, 5, 90)
+        if translated != expected:
+            mismatches.append((readings, expected, translated))
+
+    return mismatches
+
+
+if __name__ == "__main__":
+    num_traces = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    mismatches = check_against_robot(num_traces)
+
+    for readings, expected, translated in mismatches[:10]:
+        print("%r: robot %r, decode_trace %r" % (readings, expected, translated))
+    print("%d of %d traces translated differently" % (len(mismatches), num_traces))
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,245 @@
+# Advanced Robotics
+#
+# Translates recorded ambient light readings from a weak or flickering light into text on a computer. Instead of deciding whether each
+# reading is on or off by itself, the readings are treated as coming from a hidden Markov model whose states are the kinds of morse code marks
+# and spaces (dot, dash, and the spaces between dots/dashes, letters, and words) and the Viterbi algorithm finds the most likely sequence of
+# marks and spaces. A single dim reading in the middle of a dash is then much more likely to be noise than a very short space between two
+# very short marks, so it doesn't split the dash. The marks and spaces are translated with the morse_code dictionary in robotDemo.py.
+#
+# The model uses explicit durations: each kind of mark or space is a chain of states, one for each reading it has lasted so far, so how likely
+# it is to end depends on how long it has lasted. Only the first state of each chain can be reached from another kind, and the chance of
+# reaching it doesn't depend on which dot/dash or space came before, so each step only needs a handful of NumPy operations and the time is
+# linear in the number of readings. NumPy isn't available on the hub, so this file is only meant to be used on a computer.
+
+import math
+
+import numpy as np
+
+from morseBatch import classify_trace, get_runs
+from robotDemo import estimate_unit, gap_units, translate_morse_code
+
+# Each kind of mark or space, whether the light is on during it, and how many units it lasts
+symbols = [("dot", True, 1), ("dash", True, 3), ("space", False, 1), ("letter", False, gap_units["letter"]),
+           ("word", False, gap_units["word"])]
+symbols_by_name = {symbol[0]: symbol for symbol in symbols}
+
+# Chance of each kind of space after a dot/dash, and of each kind of mark after a space
+mark_to_gap = {"space": 0.6, "letter": 0.3, "word": 0.1}
+gap_to_mark = {"dot": 0.5, "dash": 0.5}
+
+
+class MorseModel:
+    """
+    The hidden Markov model for a given number of readings per unit. Every state belongs to one kind of mark or space in symbols, and the
+    states of a kind are stored next to each other starting at starts[kind]. duration_spread is how much the length of a mark or space varies,
+    as a fraction of its usual length. A word space can go on forever, so its last state can repeat with a chance of word_repeat.
+    """
+
+    def __init__(self, samples_per_unit, duration_spread=0.35, word_repeat=0.95):
+        self.starts = {}
+        symbol_ids = []
+        positions = []
+        log_exit = []
+        log_continue = []
+
+        for index, (name, light_on, units) in enumerate(symbols):
+            hazards = get_hazards(units * samples_per_unit, duration_spread, repeats=(name == "word"))
+            self.starts[name] = len(symbol_ids)
+            for position, hazard in enumerate(hazards):
+                symbol_ids.append(index)
+                positions.append(position)
+                log_exit.append(safe_log(hazard))
+                log_continue.append(safe_log(1 - hazard))
+
+        self.size = len(symbol_ids)
+        self.symbol_ids = np.array(symbol_ids)
+        self.positions = np.array(positions)
+        self.is_mark = np.array([symbols[i][1] for i in symbol_ids])
+        self.log_exit = np.array(log_exit)
+        self.log_continue = np.array(log_continue)
+
+        # The last state of a word space (the last kind in symbols) repeats instead of continuing, and can still end
+        self.repeat_state = self.size - 1
+        self.log_repeat = math.log(word_repeat)
+        self.log_exit[self.repeat_state] = math.log(1 - word_repeat)
+        self.log_continue[self.repeat_state] = -math.inf
+
+        # Every other state is reached from the state before it in the same chain
+        first_states = set(self.starts.values())
+        self.next_states = np.array([state for state in range(1, self.size) if state not in first_states])
+
+        self.mark_states = np.flatnonzero(self.is_mark)
+        self.gap_states = np.flatnonzero(~self.is_mark)
+        self.mark_starts = np.array([self.starts[name] for name in gap_to_mark])
+        self.gap_starts = np.array([self.starts[name] for name in mark_to_gap])
+        self.log_gap_to_mark = np.log(np.array(list(gap_to_mark.values())))
+        self.log_mark_to_gap = np.log(np.array(list(mark_to_gap.values())))
+
+
+def get_hazards(length, duration_spread, repeats=False):
+    """
+    Returns the chance that a mark or space ends after each reading, given that it has lasted that long, for lengths that are roughly normally
+    distributed around length readings. If repeats is True the list stops at the usual length, because the last state repeats.
+    """
+    spread = max(1.0, duration_spread * length)
+    longest = int(math.ceil(length + 3 * spread))
+    chances = [math.exp(-0.5 * ((readings - length) / spread) ** 2) for readings in range(1, longest + 1)]
+
+    if repeats:
+        longest = max(1, int(round(length)))
+        chances = chances[:longest]
+
+    hazards = []
+    remaining = sum(chances)
+    for chance in chances:
+        hazards.append(chance / remaining if remaining > 0 else 1.0)
+        remaining -= chance
+
+    if not repeats:
+        hazards[-1] = 1.0
+    return hazards
+
+
+def safe_log(value):
+    return math.log(value) if value > 0 else -math.inf
+
+
+def get_log_likelihoods(readings, level, noise, flicker):
+    """
+    Returns how likely each reading is (as a log) if the light is at level. Readings are normally distributed around level with a standard
+    deviation of noise, except that a fraction flicker of them can be any value from 0 to 100, so one bad reading can't outweigh everything else.
+    """
+    normal = -0.5 * ((readings - level) / noise) ** 2 - math.log(noise * math.sqrt(2 * math.pi))
+    return np.logaddexp(math.log(1 - flicker) + normal, math.log(flicker / 101))
+
+
+def viterbi(readings, min_light, max_light, model, noise, flicker=0.05):
+    """
+    Returns the most likely list of (kind, number of readings) pairs for readings, where noise is the standard deviation of the readings
+    around min_light and max_light and flicker is the fraction of readings that can't be trusted at all.
+    """
+    readings = np.asarray(readings, dtype=np.float64)
+    num_readings = readings.size
+    if num_readings == 0:
+        return []
+
+    # How likely each reading is if the light is on and if it is off
+    log_on = get_log_likelihoods(readings, max_light, noise, flicker)
+    log_off = get_log_likelihoods(readings, min_light, noise, flicker)
+    mark_weights = model.is_mark.astype(np.float64)
+
+    # The message can start with any mark or space, or part way through a long silence
+    scores = np.full(model.size, -math.inf)
+    scores[list(model.starts.values())] = 0.0
+    scores[model.repeat_state] = 0.0
+    scores += log_off[0] + mark_weights * (log_on[0] - log_off[0])
+
+    # For each reading, the state that the best way of starting a space or mark came from, and whether the word space repeated
+    best_marks = np.zeros(num_readings, dtype=np.int64)
+    best_gaps = np.zeros(num_readings, dtype=np.int64)
+    repeated = np.zeros(num_readings, dtype=bool)
+
+    new_scores = np.empty(model.size)
+    for t in range(1, num_readings):
+        exit_scores = scores + model.log_exit
+        best_mark = model.mark_states[np.argmax(exit_scores[model.mark_states])]
+        best_gap = model.gap_states[np.argmax(exit_scores[model.gap_states])]
+        best_marks[t] = best_mark
+        best_gaps[t] = best_gap
+
+        new_scores.fill(-math.inf)
+        new_scores[model.next_states] = scores[model.next_states - 1] + model.log_continue[model.next_states - 1]
+
+        repeat_score = scores[model.repeat_state] + model.log_repeat
+        if repeat_score > new_scores[model.repeat_state]:
+            new_scores[model.repeat_state] = repeat_score
+            repeated[t] = True
+
+        new_scores[model.mark_starts] = exit_scores[best_gap] + model.log_gap_to_mark
+        new_scores[model.gap_starts] = exit_scores[best_mark] + model.log_mark_to_gap
+
+        new_scores += log_off[t] + mark_weights * (log_on[t] - log_off[t])
+        scores, new_scores = new_scores, scores
+
+    # Trace the best path backwards one whole mark or space at a time
+    segments = []
+    state = int(np.argmax(scores))
+    t = num_readings - 1
+    while True:
+        end = t
+
+        # A word space that repeated started wherever it stopped repeating, or at the first reading if it was there from the start
+        if state == model.repeat_state:
+            while t > 0 and repeated[t]:
+                t -= 1
+        if state == model.repeat_state and t == 0:
+            start = 0
+        else:
+            start = t - model.positions[state]
+
+        name, light_on, units = symbols[model.symbol_ids[state]]
+        segments.append((name, int(end - start + 1)))
+        if start == 0:
+            break
+
+        # Marks always come after spaces and spaces after marks
+        state = int(best_gaps[start] if light_on else best_marks[start])
+        t = start - 1
+
+    segments.reverse()
+    return segments
+
+
+def segments_to_morse_lengths(segments):
+    """
+    Turns a list of (kind, number of readings) pairs from viterbi into a morse code lengths list like read_morse_with_pauses makes.
+    """
+    morse_lengths = []
+    for name, length in segments:
+        if name == "dot":
+            morse_lengths.append(1)
+        elif name == "dash":
+            morse_lengths.append(3)
+        else:
+            morse_lengths.extend([0] * gap_units[name])
+    return morse_lengths
+
+
+def decode_viterbi(readings, min_light, max_light, samples_per_unit=None, noise=None, flicker=0.05):
+    """
+    Translates an array of readings into text using the most likely sequence of marks and spaces. samples_per_unit is how many readings a dot
+    lasts; if it isn't given, it is estimated with estimate_samples_per_unit. noise is the standard deviation of the readings, a quarter of the
+    difference between max_light and min_light by default, and flicker is the fraction of readings that can't be trusted at all.
+    """
+    if noise is None:
+        noise = max(1, abs(max_light - min_light) / 4)
+
+    if samples_per_unit is None:
+        samples_per_unit = estimate_samples_per_unit(readings, min_light, max_light, noise, flicker)
+        if samples_per_unit is None:
+            return ""
+
+    model = MorseModel(samples_per_unit)
+    segments = viterbi(readings, min_light, max_light, model, noise, flicker)
+    return translate_morse_code(segments_to_morse_lengths(segments))
+
+
+def estimate_samples_per_unit(readings, min_light, max_light, noise, flicker):
+    """
+    Estimates how many readings a dot lasts. Single flickering readings break up the runs of on and off readings, so each reading is first
+    replaced by the majority of itself and its neighbors before the runs are passed to estimate_unit. That estimate is then used to find the
+    most likely marks and spaces, and the estimate is made again from their lengths, which flicker doesn't affect. Returns None if the light is
+    never on.
+    """
+    light_states = classify_trace(readings, min_light, max_light)
+    if light_states.size == 0:
+        return None
+    smoothed = np.convolve(light_states.astype(np.float64), np.ones(3) / 3, "same") > 0.5
+    runs_on, run_lengths = get_runs(smoothed)
+    samples_per_unit = estimate_unit(list(zip(runs_on.tolist(), run_lengths.tolist())))
+    if samples_per_unit is None:
+        return None
+
+    segments = viterbi(readings, min_light, max_light, MorseModel(samples_per_unit), noise, flicker)
+    refined = estimate_unit([(symbols_by_name[name][1], length) for name, length in segments])
+    return refined if refined is not None else samples_per_unit
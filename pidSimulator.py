@@ -0,0 +1,209 @@
+# Advanced Robotics
+#
+# Simulates thousands of robots following a light at once, each with its own PID gains, so the gains used by follow_light in robotDemo.py can
+# be tuned on a computer instead of by running the real robot over and over. Every robot drives on two wheels toward a single light, and the
+# readings its two color sensors would see come from a simple model of how bright the light is at each spot. The PID controllers do exactly
+# what LightFollower in robotDemo.py does, but on NumPy arrays with one entry per robot, so each step of the simulation moves every robot at
+# once. For each robot, the simulation reports how long it took to come to a stop (settling time), how far it went past the spot where it
+# should have stopped (overshoot), and how far from the light it ended up (stop distance). NumPy isn't available on the hub, so this file is
+# only meant to be used on a computer.
+#
+# Usage: python pidSimulator.py [--duration SECONDS] [--dt SECONDS] [--steps N] [--top N]
+
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+
+class LightField:
+    """
+    How bright a light at (0, 0) looks to a color sensor, in the 0-100 range of get_ambient_light. The light falls off with the distance from
+    the light, reaching half of brightness (above background) at spread centimeters, and a sensor facing away from the light sees less of it
+    than one facing straight at it. Readings are rounded to whole numbers like the real sensor's.
+    """
+
+    def __init__(self, brightness=95, background=5, spread=30):
+        self.brightness = brightness
+        self.background = background
+        self.spread = spread
+
+    def read(self, x, y, heading):
+        """
+        Returns the readings of sensors at positions (x, y) facing in the direction heading (in radians), for arrays of positions and headings.
+        """
+        distance = np.hypot(x, y)
+        facing = (1 + np.cos(np.arctan2(-y, -x) - heading)) / 2     # 1 when facing straight at the light, 0 when facing directly away
+        light = self.background + self.brightness * facing / (1 + (distance / self.spread) ** 2)
+        return np.clip(np.rint(light), 0, 100)
+
+    def distance_for(self, level):
+        """
+        Returns how far from the light a sensor facing straight at it reads level.
+        """
+        if level <= self.background:
+            return math.inf
+        if level >= self.background + self.brightness:
+            return 0.0
+        return self.spread * math.sqrt(self.brightness / (level - self.background) - 1)
+
+
+class RobotModel:
+    """
+    The size and speed of the simulated robots. Each wheel is wheel_diameter centimeters across and turns max_speed degrees per second at 100%
+    power, the wheels are track_width centimeters apart, and each color sensor is sensor_forward centimeters in front of the middle of the
+    wheels and sensor_spacing centimeters from the other sensor.
+    """
+
+    def __init__(self, wheel_diameter=5.6, track_width=11.2, max_speed=1000, sensor_forward=8, sensor_spacing=6):
+        self.wheel_diameter = wheel_diameter
+        self.track_width = track_width
+        self.max_speed = max_speed
+        self.sensor_forward = sensor_forward
+        self.sensor_spacing = sensor_spacing
+
+    def wheel_speed(self, power):
+        """
+        Returns how fast a wheel moves the robot, in centimeters per second, for an array of motor powers.
+        """
+        return np.clip(power, -100, 100) / 100 * self.max_speed / 360 * math.pi * self.wheel_diameter
+
+
+def gain_grid(gains_p, gains_i, gains_d):
+    """
+    Returns three arrays (gain_p, gain_i, gain_d) with one entry for every combination of the given values of each gain.
+    """
+    grid = np.meshgrid(np.asarray(gains_p, dtype=np.float64), np.asarray(gains_i, dtype=np.float64), np.asarray(gains_d, dtype=np.float64),
+                       indexing="ij")
+    return tuple(values.ravel() for values in grid)
+
+
+def simulate(gain_p, gain_i, gain_d, max_light=90, duration=20, dt=0.02, start_distance=60, start_angle=20, field=None, robot=None,
+             settle_speed=0.5):
+    """
+    Simulates one robot for each entry of the gain arrays following the light for duration seconds, with the controllers updated every dt
+    seconds like follow_light with a LoopScheduler. Every robot starts start_distance centimeters from the light with the light start_angle
+    degrees to its left. Returns a dictionary of arrays with one entry per robot:
+
+        "settling_time"    seconds until the robot slowed below settle_speed centimeters per second for the rest of the run, nan if it never did
+        "overshoot"        centimeters the robot went past the spot where a sensor facing the light would read max_light, 0 if it never did
+        "stop_distance"    centimeters between the middle of the robot and the light at the end of the run
+    """
+    if field is None:
+        field = LightField()
+    if robot is None:
+        robot = RobotModel()
+
+    gain_p, gain_i, gain_d = np.broadcast_arrays(np.asarray(gain_p, dtype=np.float64), np.asarray(gain_i, dtype=np.float64),
+                                                 np.asarray(gain_d, dtype=np.float64))
+    num_robots = gain_p.size
+    gain_p = gain_p.ravel()
+    gain_i = gain_i.ravel()
+    gain_d = gain_d.ravel()
+
+    # Every robot starts at the same spot on the x axis, turned away from the light by start_angle
+    x = np.full(num_robots, float(start_distance))
+    y = np.zeros(num_robots)
+    heading = np.full(num_robots, math.pi - math.radians(start_angle))
+
+    # PID variables, the same as LightFollower's
+    left_error_sum = np.zeros(num_robots)
+    right_error_sum = np.zeros(num_robots)
+    left_prev_error = np.zeros(num_robots)
+    right_prev_error = np.zeros(num_robots)
+
+    min_distance = np.full(num_robots, float(start_distance))
+    last_moving = np.zeros(num_robots)     # Time each robot was last moving faster than settle_speed
+    moving = np.ones(num_robots, dtype=bool)
+
+    half_spacing = robot.sensor_spacing / 2
+    num_steps = int(round(duration / dt))
+
+    for step in range(num_steps):
+        # Where each sensor is, given the middle of the robot and the way it is facing
+        cos_heading = np.cos(heading)
+        sin_heading = np.sin(heading)
+        front_x = x + robot.sensor_forward * cos_heading
+        front_y = y + robot.sensor_forward * sin_heading
+        left_light = field.read(front_x - half_spacing * sin_heading, front_y + half_spacing * cos_heading, heading)
+        right_light = field.read(front_x + half_spacing * sin_heading, front_y - half_spacing * cos_heading, heading)
+
+        left_error = max_light - left_light
+        right_error = max_light - right_light
+
+        # If one of the sensors has an error of 0, the robot is close enough to the light to stop moving and the integral terms are reset
+        stopped = (left_error == 0) | (right_error == 0)
+        left_error = np.where(stopped, 0, left_error)
+        right_error = np.where(stopped, 0, right_error)
+        left_error_sum = np.where(stopped, 0, left_error_sum + left_error)
+        right_error_sum = np.where(stopped, 0, right_error_sum + right_error)
+
+        # If one of the differential terms is 0, the other is set to 0 too
+        left_error_diff = left_error - left_prev_error
+        right_error_diff = right_error - right_prev_error
+        no_change = (left_error_diff == 0) | (right_error_diff == 0)
+        left_error_diff = np.where(no_change, 0, left_error_diff)
+        right_error_diff = np.where(no_change, 0, right_error_diff)
+
+        left_prev_error = left_error
+        right_prev_error = right_error
+
+        # int() in LightFollower rounds toward 0, like np.trunc
+        left_power = np.trunc(gain_p * left_error + gain_i * left_error_sum + gain_d * left_error_diff)
+        right_power = np.trunc(gain_p * right_error + gain_i * right_error_sum + gain_d * right_error_diff)
+
+        # Drive both wheels for one step
+        left_speed = robot.wheel_speed(left_power)
+        right_speed = robot.wheel_speed(right_power)
+        speed = (left_speed + right_speed) / 2
+        x += speed * cos_heading * dt
+        y += speed * sin_heading * dt
+        heading += (right_speed - left_speed) / robot.track_width * dt
+
+        np.minimum(min_distance, np.hypot(x, y), out=min_distance)
+        moving = (np.abs(left_speed) + np.abs(right_speed)) / 2 > settle_speed
+        last_moving = np.where(moving, (step + 1) * dt, last_moving)
+
+    # The sensors are in front of the middle of the robot, so the middle should stop sensor_forward further away
+    target_distance = field.distance_for(max_light) + robot.sensor_forward
+
+    return {
+        "settling_time": np.where(moving, np.nan, last_moving),
+        "overshoot": np.maximum(0, target_distance - min_distance),
+        "stop_distance": np.hypot(x, y),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Sweep a grid of PID gains for follow_light in simulation.")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to simulate each robot for (default: 20)")
+    parser.add_argument("--dt", type=float, default=0.02, help="seconds between controller updates (default: 0.02)")
+    parser.add_argument("--steps", type=int, default=20, help="number of values of each gain to try (default: 20)")
+    parser.add_argument("--top", type=int, default=10, help="number of best gains to print (default: 10)")
+    args = parser.parse_args(args)
+
+    # Values around follow_light's gains of 0.3, 0.0001, and 0.4
+    gain_p, gain_i, gain_d = gain_grid(np.linspace(0.05, 1.0, args.steps), np.linspace(0, 0.001, args.steps),
+                                       np.linspace(0, 2.0, args.steps))
+
+    start = time.perf_counter()
+    results = simulate(gain_p, gain_i, gain_d, duration=args.duration, dt=args.dt)
+    elapsed = time.perf_counter() - start
+
+    # Robots that settled, fastest first, with overshoot breaking ties
+    settled = np.flatnonzero(~np.isnan(results["settling_time"]))
+    order = settled[np.lexsort((results["overshoot"][settled], results["settling_time"][settled]))]
+
+    print("%8s %8s %8s %10s %10s %10s" % ("gain_p", "gain_i", "gain_d", "settling", "overshoot", "stop"))
+    for index in order[:args.top]:
+        print("%8.3f %8.5f %8.3f %9.2fs %8.1fcm %8.1fcm" % (gain_p[index], gain_i[index], gain_d[index], results["settling_time"][index],
+                                                            results["overshoot"][index], results["stop_distance"][index]))
+
+    print("Simulated %d robots (%d settled) for %g seconds each in %.2f seconds" % (gain_p.size, settled.size, args.duration, elapsed),
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
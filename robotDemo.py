@@ -3,21 +3,128 @@
 # Advanced Robotics
 #
 # This program allows a robot to follow a light and translate morse code. The robot's speed is controlled by two PID controllers.
-# The robot is only capable of translating one word from morse code.
+# The robot can translate whole messages from morse code, with words separated by spaces.
 
-from spike import PrimeHub, LightMatrix, Button, StatusLight, ForceSensor, MotionSensor, Speaker, ColorSensor, App, DistanceSensor, Motor, MotorPair
-from spike.control import wait_for_seconds, wait_until, Timer
 from math import *
 
-# Initialize hub, left color sensor, right color sensor, left motor, right motor, and the timer
-hub = PrimeHub()
-left_sensor = ColorSensor('A')
-right_sensor = ColorSensor('F')
-left_motor = Motor('C')
-right_motor = Motor('D')
-timer = Timer()
+# The hub, left color sensor, right color sensor, left motor, right motor, and the timer, along with the wait and clock functions of the
+# backend they come from. The backend is set by use_backend and everything else is created by init_hardware the first time it is needed.
+backend = None
+hub = None
+left_sensor = None
+right_sensor = None
+left_motor = None
+right_motor = None
+timer = None
+wait_for_seconds = None
+ticks_ms = None
+ticks_us = None
+ticks_diff = None
 
-# Morse code translation for each letter in the English alphabet
+
+class SpikeBackend:
+    """
+    Backend for running on the Lego Spike hub. A backend provides the PrimeHub, ColorSensor, Motor, and Timer classes along with the
+    wait_for_seconds, ticks_ms, ticks_us, and ticks_diff functions. The spike modules are only imported when this backend is created, so this file can
+    still be imported on a computer and used with a different backend, like the simulated hub in simulatedHub.py.
+    """
+
+    def __init__(self):
+        from spike import PrimeHub, ColorSensor, Motor
+        from spike.control import wait_for_seconds, Timer
+        from utime import ticks_ms, ticks_us, ticks_diff
+
+        self.PrimeHub = PrimeHub
+        self.ColorSensor = ColorSensor
+        self.Motor = Motor
+        self.Timer = Timer
+        self.wait_for_seconds = wait_for_seconds
+        self.ticks_ms = ticks_ms
+        self.ticks_us = ticks_us
+        self.ticks_diff = ticks_diff
+
+
+def use_backend(new_backend):
+    """
+    Use new_backend for the hub, sensors, motors, timer, and the wait and clock functions from now on. Nothing is created until it is needed,
+    so any hardware that was already created is thrown away and will be created again using new_backend.
+    """
+    global backend, hub
+
+    backend = new_backend
+    hub = None
+
+
+def init_hardware():
+    """
+    Initialize the hub, left color sensor, right color sensor, left motor, right motor, and the timer the first time they are needed. If no
+    backend has been chosen with use_backend, the Lego Spike backend is used. Every function that uses the hardware calls this first, so just
+    importing this file doesn't touch the hub.
+    """
+    global backend, hub, left_sensor, right_sensor, left_motor, right_motor, timer, wait_for_seconds, ticks_ms, ticks_us, ticks_diff
+
+    # The hardware has already been initialized
+    if hub is not None:
+        return
+
+    if backend is None:
+        backend = SpikeBackend()
+
+    hub = backend.PrimeHub()
+    left_sensor = backend.ColorSensor('A')
+    right_sensor = backend.ColorSensor('F')
+    left_motor = MotorCommands(backend.Motor('C'))
+    right_motor = MotorCommands(backend.Motor('D'))
+    timer = backend.Timer()
+    wait_for_seconds = backend.wait_for_seconds
+    ticks_ms = backend.ticks_ms
+    ticks_us = backend.ticks_us
+    ticks_diff = backend.ticks_diff
+
+
+class MotorCommands:
+    """
+    Wraps a motor so that starting it at the speed it is already running at doesn't send another command. If the new speed is within deadband
+    of the last speed sent, the command is skipped too, except that stopping (a speed of 0) is always sent. The number of start commands sent
+    and skipped are counted in sent and suppressed. Anything else is passed straight to the motor.
+    """
+
+    def __init__(self, motor, deadband=0):
+        self.motor = motor
+        self.deadband = deadband
+        self.last_speed = None  # Last speed sent to the motor, None if it isn't known
+        self.sent = 0
+        self.suppressed = 0
+
+    def start(self, speed=None):
+        # Without a speed the motor uses its default speed, so the last speed isn't known anymore
+        if speed is None:
+            self.motor.start()
+            self.last_speed = None
+            self.sent += 1
+            return
+
+        if self.last_speed is not None and abs(speed - self.last_speed) <= self.deadband and (speed != 0 or self.last_speed == 0):
+            self.suppressed += 1
+            return
+
+        self.motor.start(speed=speed)
+        self.last_speed = speed
+        self.sent += 1
+
+    def stop(self):
+        self.motor.stop()
+        self.last_speed = 0
+
+    def reset_counts(self):
+        self.sent = 0
+        self.suppressed = 0
+
+    def __getattr__(self, name):
+        return getattr(self.motor, name)
+
+
+# Morse code translation for each letter in the English alphabet, each digit, and common punctuation
 # A dot is represented by a 1
 # A dash is represented by a 3
 # 0 represents the intra-character space
@@ -47,15 +154,56 @@ morse_code = {
     "W": [1, 0, 3, 0, 3],
     "X": [3, 0, 1, 0, 1, 0, 3],
     "Y": [3, 0, 1, 0, 3, 0, 3],
-    "Z": [3, 0, 3, 0, 1, 0, 1]
+    "Z": [3, 0, 3, 0, 1, 0, 1],
+    "0": [3, 0, 3, 0, 3, 0, 3, 0, 3],
+    "1": [1, 0, 3, 0, 3, 0, 3, 0, 3],
+    "2": [1, 0, 1, 0, 3, 0, 3, 0, 3],
+    "3": [1, 0, 1, 0, 1, 0, 3, 0, 3],
+    "4": [1, 0, 1, 0, 1, 0, 1, 0, 3],
+    "5": [1, 0, 1, 0, 1, 0, 1, 0, 1],
+    "6": [3, 0, 1, 0, 1, 0, 1, 0, 1],
+    "7": [3, 0, 3, 0, 1, 0, 1, 0, 1],
+    "8": [3, 0, 3, 0, 3, 0, 1, 0, 1],
+    "9": [3, 0, 3, 0, 3, 0, 3, 0, 1],
+    ".": [1, 0, 3, 0, 1, 0, 3, 0, 1, 0, 3],
+    ",": [3, 0, 3, 0, 1, 0, 1, 0, 3, 0, 3],
+    "?": [1, 0, 1, 0, 3, 0, 3, 0, 1, 0, 1],
+    "'": [1, 0, 3, 0, 3, 0, 3, 0, 3, 0, 1],
+    "!": [3, 0, 1, 0, 3, 0, 1, 0, 3, 0, 3],
+    "/": [3, 0, 1, 0, 1, 0, 3, 0, 1],
+    "(": [3, 0, 1, 0, 3, 0, 3, 0, 1],
+    ")": [3, 0, 1, 0, 3, 0, 3, 0, 1, 0, 3],
+    "&": [1, 0, 3, 0, 1, 0, 1, 0, 1],
+    ":": [3, 0, 3, 0, 3, 0, 1, 0, 1, 0, 1],
+    ";": [3, 0, 1, 0, 3, 0, 1, 0, 3, 0, 1],
+    "=": [3, 0, 1, 0, 1, 0, 1, 0, 3],
+    "+": [1, 0, 3, 0, 1, 0, 3, 0, 1],
+    "-": [3, 0, 1, 0, 1, 0, 1, 0, 1, 0, 3],
+    "_": [1, 0, 1, 0, 3, 0, 3, 0, 1, 0, 3],
+    '"': [1, 0, 3, 0, 1, 0, 1, 0, 3, 0, 1],
+    "$": [1, 0, 1, 0, 1, 0, 3, 0, 1, 0, 1, 0, 3],
+    "@": [1, 0, 3, 0, 3, 0, 1, 0, 3, 0, 1]
 }
 
+# Spaces between letters are three units and spaces between words are seven units
+letter_gap = 3
+word_gap = 7
+
+# Number of units in each kind of space, by the names classify_light_runs gives them
+gap_units = {"space": 1, "letter": letter_gap, "word": word_gap}
+
+# Reverse of the morse_code dictionary so a letter can be looked up directly from its morse code instead of checking every letter.
+# Lists can't be dictionary keys, so each letter's morse code is stored as a tuple.
+morse_lookup = {tuple(code): letter for letter, code in morse_code.items()}
+
 
 def calibrate():
     """
     Calibrate the robot by first shining a flashlight directly at the robot's left sensor and pressing the right button after the robot beeps.
     When it beeps again, turn the flashlight off and press the right button again.
     """
+    init_hardware()
+
     hub.speaker.beep()  # Ready to take reading
 
     # Take reading of max light when right button is pressed
@@ -72,30 +220,389 @@ def calibrate():
     return (max_light, min_light)
 
 
-def follow_light(duration=20, max_light=90):
+def calibrate_auto(duration=0.5, sample_rate=100, attempts=3):
+    """
+    Calibrate the robot without pressing any buttons. The robot beeps and then reads the left sensor sample_rate times a second for duration
+    seconds. Flash the flashlight on and off at the robot's left sensor while it is reading. The readings are split into on and off levels
+    with split_light_levels, and the same (max_light, min_light) tuple as calibrate() is returned. If the light wasn't flashed, the robot
+    beeps and reads again, up to attempts times in all, and returns None if it never saw the light flash.
+    """
+    init_hardware()
+
+    for attempt in range(attempts):
+        hub.speaker.beep()  # Ready to take readings
+
+        readings = [reading for time, reading in sample_light(duration, sample_rate)]
+        levels = split_light_levels(readings)
+        if levels is not None:
+            return levels
+
+    return None
+
+
+def calibrate_sensors(duration=0.5, sample_rate=100):
+    """
+    Calibrate both color sensors at once the same way as calibrate_auto. Flash the flashlight on and off so that it shines on both sensors.
+    Each sensor is calibrated separately, since they don't see exactly the same light, and a ((max_light, min_light), (max_light, min_light))
+    tuple for the left and right sensors is returned, which can be passed to FusedLight. Returns None if either sensor didn't see the light
+    flash (see split_light_levels).
+    """
+    init_hardware()
+
+    hub.speaker.beep()  # Ready to take readings
+
+    read_both = lambda: (left_sensor.get_ambient_light(), right_sensor.get_ambient_light())
+    samples = [readings for time, readings in sample_light(duration, sample_rate, read_both)]
+    left_levels = split_light_levels([left for left, right in samples])
+    right_levels = split_light_levels([right for left, right in samples])
+    if left_levels is None or right_levels is None:
+        return None
+
+    return (left_levels, right_levels)
+
+
+def split_light_levels(readings, min_contrast=10):
+    """
+    Splits ambient light readings into the readings taken with the light on and the ones taken with it off, and returns the
+    (max_light, min_light) tuple of the typical on and off levels. The readings are counted in a histogram of the 0-100 light values, and the
+    split is the value that makes the two groups as different from each other as possible (Otsu's method). Each level is the median of its
+    group, so a few noisy readings don't move it. If the levels are less than min_contrast apart (the same minimum as AdaptiveThreshold's),
+    the light was never flashed and the split is only noise, so None is returned instead.
+    """
+    # Count how many readings there are of each light value
+    counts = [0] * 101
+    for reading in readings:
+        counts[max(0, min(100, int(reading)))] += 1
+
+    total = sum(counts)
+    if total == 0:
+        return None
+    total_sum = sum(value * count for value, count in enumerate(counts))
+
+    # Try splitting after each light value and keep the split with the largest variance between the two groups
+    best_split = None
+    best_variance = 0
+    off_count = 0
+    off_sum = 0
+    for value in range(100):
+        off_count += counts[value]
+        off_sum += value * counts[value]
+        on_count = total - off_count
+        if off_count == 0 or on_count == 0:
+            continue
+
+        off_mean = off_sum / off_count
+        on_mean = (total_sum - off_sum) / on_count
+        variance = off_count * on_count * (on_mean - off_mean) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_split = value
+
+    # All of the readings were the same
+    if best_split is None:
+        return None
+
+    max_light = median_of_counts(counts, best_split + 1, 100)
+    min_light = median_of_counts(counts, 0, best_split)
+    if max_light - min_light < min_contrast:
+        return None
+
+    return (max_light, min_light)
+
+
+def median_of_counts(counts, low, high):
+    """
+    Returns the median light value of the readings counted in counts with values from low to high.
+    """
+    total = sum(counts[low:high + 1])
+    seen = 0
+    for value in range(low, high + 1):
+        seen += counts[value]
+        if seen * 2 >= total:
+            return value
+    return high
+
+
+class LoopScheduler:
+    """
+    Runs a loop at a fixed rate of rate iterations per second. Each iteration is scheduled from the time the loop started, so the loop doesn't
+    drift. If an iteration takes longer than one period, the next one starts right away, the missed deadline is counted in overruns, and the
+    loop skips ahead to the next period instead of running several iterations in a row to catch up. The longest time any iteration ran past
+    its deadline is kept in max_overrun, in milliseconds.
+    """
+
+    def __init__(self, rate):
+        self.period = 1000 / rate   # Milliseconds between iterations
+        self.start_time = 0         # Time the loop started
+        self.last_time = 0          # Time the last iteration started, in milliseconds since the loop started
+        self.deadline = 0           # Time the next iteration is due to start, in milliseconds since the loop started
+        self.iterations = 0
+        self.overruns = 0
+        self.max_overrun = 0
+
+    def start(self):
+        """
+        Start the loop and reset the iteration and overrun counts.
+        """
+        self.start_time = ticks_ms()
+        self.last_time = 0
+        self.deadline = 0
+        self.iterations = 0
+        self.overruns = 0
+        self.max_overrun = 0
+
+    def wait(self):
+        """
+        Wait until the next iteration is due to start. Returns how many seconds it has been since the last iteration started, or one period
+        for the first iteration.
+        """
+        now = ticks_diff(ticks_ms(), self.start_time)
+
+        if now > self.deadline:
+            # The last iteration ran past this one's deadline, so start right away and move the deadline to the next period after now
+            if self.iterations > 0:
+                self.overruns += 1
+                self.max_overrun = max(self.max_overrun, now - self.deadline)
+            self.deadline += ((now - self.deadline) // self.period + 1) * self.period
+        else:
+            wait_for_seconds((self.deadline - now) / 1000)
+            now = ticks_diff(ticks_ms(), self.start_time)
+            self.deadline += self.period
+
+        if self.iterations == 0:
+            dt = self.period
+        else:
+            dt = now - self.last_time
+
+        self.last_time = now
+        self.iterations += 1
+        return dt / 1000
+
+
+class TaskRunner:
+    """
+    Runs several tasks together on one loop so the robot can do more than one thing at a time without threads. A task is a generator that
+    does a little work each time it runs and then yields how many milliseconds to wait before it runs again, so each task runs at its own rate.
+    The runner always runs whichever task is due first. Like LoopScheduler, each task's next run is scheduled from when its last run was due
+    rather than from when it finished. If a task falls behind, it runs as soon as it can, and its next run skips ahead to the next whole delay
+    after that instead of running several times in a row to catch up. A task finishes when its generator returns.
+    """
+
+    def __init__(self):
+        self.tasks = []     # [due time in milliseconds since the runner started, task] for each task that hasn't finished
+
+    def add(self, task, delay=0):
+        """
+        Add a task, which first runs delay milliseconds after the runner starts.
+        """
+        self.tasks.append([delay, task])
+
+    def run(self, duration=None):
+        """
+        Run the tasks until they have all finished, or for at most duration seconds. Any tasks that haven't finished are then closed, so
+        they can clean up (like stopping the motors) in a finally block.
+        """
+        init_hardware()
+
+        start = ticks_ms()
+
+        while self.tasks:
+            entry = min(self.tasks, key=lambda entry: entry[0])
+            if duration is not None and entry[0] >= duration * 1000:
+                break
+
+            wait_until(start, entry[0])
+
+            try:
+                delay = next(entry[1])
+            except StopIteration:
+                self.tasks.remove(entry)
+                continue
+
+            # If the next run is already overdue, skip the runs that were missed, like LoopScheduler.wait
+            now = ticks_diff(ticks_ms(), start)
+            entry[0] += delay
+            if entry[0] <= now:
+                entry[0] = now if delay <= 0 else entry[0] + ((now - entry[0]) // delay + 1) * delay
+
+        for due_time, task in self.tasks:
+            task.close()
+        self.tasks = []
+
+
+class LoopTimings:
+    """
+    Records how long each iteration of a loop takes, in microseconds, keeping only the last size iterations so recording never allocates memory.
+    For each iteration it keeps the total latency, how long reading the sensors took, how long sending the motor commands took, and the jitter,
+    which is how far the time between the starts of two iterations was from the expected period (or from the previous time between starts if
+    there is no expected period).
+    """
+
+    names = ("iteration", "sensor", "actuation", "jitter")
+
+    def __init__(self, size=256):
+        self.size = size
+        self.values = {}
+        self.start()
+
+    def start(self, period=None):
+        """
+        Clear all recorded iterations. period is the expected time between iterations in milliseconds, if there is one.
+        """
+        for name in self.names:
+            self.values[name] = [0] * self.size
+        self.expected_interval = None if period is None else int(period * 1000)
+        self.last_interval = None
+        self.index = 0      # Where the next iteration will be recorded
+        self.count = 0      # How many iterations have been recorded, up to size
+
+    def record(self, interval, iteration, sensor, actuation):
+        """
+        Record one iteration. interval is the time since the previous iteration started, or None for the first iteration.
+        """
+        jitter = 0
+        if interval is not None:
+            expected = self.expected_interval
+            if expected is None:
+                expected = self.last_interval
+            if expected is not None:
+                jitter = abs(interval - expected)
+            self.last_interval = interval
+
+        self.values["iteration"][self.index] = iteration
+        self.values["sensor"][self.index] = sensor
+        self.values["actuation"][self.index] = actuation
+        self.values["jitter"][self.index] = jitter
+
+        self.index = (self.index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def summary(self):
+        """
+        Returns a dictionary from each measurement name to a (min, p50, p99, max) tuple of the recorded iterations, in microseconds.
+        """
+        result = {}
+        for name in self.names:
+            values = sorted(self.values[name][:self.count])
+            if values:
+                result[name] = (values[0], percentile(values, 50), percentile(values, 99), values[-1])
+            else:
+                result[name] = (0, 0, 0, 0)
+        return result
+
+
+def percentile(sorted_values, percent):
+    """
+    Returns the value percent of the way through a sorted list, using the nearest value instead of interpolating.
+    """
+    index = int(round(percent / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def follow_light(duration=20, max_light=90, scheduler=None, timings=None, deadband=0, receiver=None):
     """
     The robot will follow a light source for duration seconds. If the light turns to the left, the robot will turn to the left. 
     If the light turns to the right, the robot will turn to the right. If either sensor detects an ambient light value >= max_light, 
     the robot will stop. The robot will start moving again if the light starts moving away from the robot.
+
+    Without a scheduler, the loop runs as fast as the sensors can be read. If a LoopScheduler is given, the loop runs at its rate and the
+    integral and differential terms are scaled by how long each iteration actually took compared to the scheduler's period, so the gains
+    behave the same no matter how late an iteration runs. The scheduler keeps its overrun count after the robot stops.
+
+    If a LoopTimings is given, the time each iteration spends reading the sensors and starting the motors is recorded in it.
+
+    A motor is only sent a new speed when it differs from the last one by more than deadband. The number of commands sent and skipped during
+    the run are kept in left_motor and right_motor afterwards.
+
+    If a MorseReceiver is given, every left sensor reading is also passed to it, so morse code flashed by the light being followed is translated
+    without reading the sensor a second time. The translation is in receiver.message when the robot stops.
     """
-    # PID variables
-    left_error_sum = 0
-    right_error_sum = 0
-    left_prev_error = 0
-    right_prev_error = 0
-    gain_p = 0.3
-    gain_i = 0.0001
-    gain_d = 0.4
+    init_hardware()
+
+    left_motor.deadband = deadband
+    right_motor.deadband = deadband
+    left_motor.reset_counts()
+    right_motor.reset_counts()
+
+    follower = LightFollower(max_light)
     
+    time_scale = 1     # How long the current iteration took compared to the scheduler's period
+
+    iteration_start = None  # Time the last iteration started, in microseconds, when timings are being recorded
+
     timer.reset()   # Make sure the timer is set to 0
+    start = ticks_ms()
+    if scheduler is not None:
+        scheduler.start()
+    if timings is not None:
+        timings.start(None if scheduler is None else scheduler.period)
 
     # Follow a light source for duration seconds
     while timer.now() <= duration:
+        if scheduler is not None:
+            time_scale = scheduler.wait() * 1000 / scheduler.period
+
+        if timings is not None:
+            last_start = iteration_start
+            iteration_start = ticks_us()
+
         left_light = left_sensor.get_ambient_light()    # Amount of ambient light on the left side of the front of the robot
         right_light = right_sensor.get_ambient_light()  # Amount of ambient light on the right side of the front of the robot
 
-        left_error = max_light - left_light     # How far off the left sensor reading is from the threshold
-        right_error = max_light - right_light   # How far off the right sensor reading is from the threshold
+        if timings is not None:
+            sensor_end = ticks_us()
+
+        if receiver is not None:
+            receiver.add(ticks_diff(ticks_ms(), start), left_light)
+
+        left_power, right_power = follower.update(left_light, right_light, time_scale)
+            
+        if timings is not None:
+            actuation_start = ticks_us()
+
+        left_motor.start(speed=-left_power)
+        right_motor.start(speed=right_power)
+
+        if timings is not None:
+            iteration_end = ticks_us()
+            interval = None if last_start is None else ticks_diff(iteration_start, last_start)
+            timings.record(interval, ticks_diff(iteration_end, iteration_start), ticks_diff(sensor_end, iteration_start),
+                           ticks_diff(iteration_end, actuation_start))
+
+    left_motor.stop()
+    right_motor.stop()
+
+    if receiver is not None:
+        receiver.finish(ticks_diff(ticks_ms(), start))
+
+
+class LightFollower:
+    """
+    The two PID controllers that follow_light uses to turn sensor readings into wheel speeds, one for each side of the robot. Each controller's
+    error is how far its sensor's reading is from max_light, and the robot stops once either sensor reaches it. Keeping the controllers
+    separate from the loop lets any loop that reads the sensors drive the robot the same way.
+    """
+
+    def __init__(self, max_light=90, gain_p=0.3, gain_i=0.0001, gain_d=0.4):
+        self.max_light = max_light
+        self.gain_p = gain_p
+        self.gain_i = gain_i
+        self.gain_d = gain_d
+
+        # PID variables
+        self.left_error_sum = 0
+        self.right_error_sum = 0
+        self.left_prev_error = 0
+        self.right_prev_error = 0
+
+    def update(self, left_light, right_light, time_scale=1):
+        """
+        Returns the (left_power, right_power) to drive the wheels at for one pair of readings. time_scale is how long it has been since the last
+        update compared to the usual time between updates, which scales the integral and differential terms. The left motor is mounted facing
+        the other way, so it should be started at -left_power.
+        """
+        left_error = self.max_light - left_light     # How far off the left sensor reading is from the threshold
+        right_error = self.max_light - right_light   # How far off the right sensor reading is from the threshold
 
         # If one of the sensors has an error of 0, the robot is close enough to the light to stop moving
         if left_error == 0 or right_error == 0:
@@ -103,44 +610,219 @@ def follow_light(duration=20, max_light=90):
             right_error = 0
             
             # Reset the integral terms to 0 if the error is 0 to make sure the integral term doesn't cause the robot not to stop
-            left_error_sum = 0
-            right_error_sum = 0
+            self.left_error_sum = 0
+            self.right_error_sum = 0
         else:
-            left_error_sum = left_error_sum + left_error        # The sum of all of the errors from the left sensor readings
-            right_error_sum = right_error_sum + right_error     # The sum of all of the errors from the right sensor readings
+            self.left_error_sum = self.left_error_sum + left_error * time_scale       # The sum of all of the errors from the left sensor readings
+            self.right_error_sum = self.right_error_sum + right_error * time_scale    # The sum of all of the errors from the right sensor readings
 
-        left_error_diff = left_error - left_prev_error      # The differential term of the left sensor readings
-        right_error_diff = right_error - right_prev_error   # The differential term of the right sensor readings
+        left_error_diff = left_error - self.left_prev_error      # The differential term of the left sensor readings
+        right_error_diff = right_error - self.right_prev_error   # The differential term of the right sensor readings
 
         # If one of the differential terms is 0, set the other to 0 so that both wheels will stop moving
         if left_error_diff == 0 or right_error_diff == 0:
             left_error_diff = 0
             right_error_diff = 0
 
-        left_prev_error = left_error    # Set the previous left sensor error to be the current one
-        right_prev_error = right_error  # Set the previous right sensor error to be the current one
+        # Turn the differences into rates of change so a longer iteration doesn't make the differential terms bigger
+        left_error_diff = left_error_diff / time_scale
+        right_error_diff = right_error_diff / time_scale
+
+        self.left_prev_error = left_error    # Set the previous left sensor error to be the current one
+        self.right_prev_error = right_error  # Set the previous right sensor error to be the current one
 
         # The speed of the left wheel is controlled by the left sensor error, error sum, and error differential
         # The speed of the right wheel is controlled by the right sensor error, error sum, and error differential
-        left_power = int(gain_p * left_error + gain_i * left_error_sum + gain_d * left_error_diff)
-        right_power = int(gain_p * right_error + gain_i * right_error_sum + gain_d * right_error_diff)
-            
-        left_motor.start(speed=-left_power)
-        right_motor.start(speed=right_power)
+        left_power = int(self.gain_p * left_error + self.gain_i * self.left_error_sum + self.gain_d * left_error_diff)
+        right_power = int(self.gain_p * right_error + self.gain_i * self.right_error_sum + self.gain_d * right_error_diff)
 
-    left_motor.stop()
-    right_motor.stop()
+        return (left_power, right_power)
+
+
+def follow_light_task(max_light=90, rate=50, follower=None, receiver=None):
+    """
+    Task for a TaskRunner that follows a light the same way as follow_light, updating the wheel speeds rate times a second until the runner
+    stops it. The integral and differential terms are scaled by how long each update actually took compared to the usual time between them.
+    If a MorseReceiver is given, each left sensor reading is also passed to it, like in follow_light, so no separate receive_morse_task is needed.
+    """
+    init_hardware()
+
+    if follower is None:
+        follower = LightFollower(max_light)
+
+    period = 1000 / rate    # Milliseconds between updates
+    start = ticks_ms()
+    last_time = None        # Time of the last update
+
+    try:
+        while True:
+            now = ticks_ms()
+            # If the ticks haven't changed since the last update, count it as 1 millisecond so the differential terms never divide by 0
+            time_scale = 1 if last_time is None else max(1, ticks_diff(now, last_time)) / period
+            last_time = now
+
+            left_light = left_sensor.get_ambient_light()
+            right_light = right_sensor.get_ambient_light()
+            if receiver is not None:
+                receiver.add(ticks_diff(now, start), left_light)
+
+            left_power, right_power = follower.update(left_light, right_light, time_scale)
+            left_motor.start(speed=-left_power)
+            right_motor.start(speed=right_power)
+
+            yield period
+    finally:
+        left_motor.stop()
+        right_motor.stop()
+        if receiver is not None:
+            receiver.finish(ticks_diff(ticks_ms(), start))
+
+
+def receive_morse_task(receiver, sample_rate=50, read=None):
+    """
+    Task for a TaskRunner that reads the light sample_rate times a second and passes each reading to receiver, a MorseReceiver, until the
+    runner stops it. read is the function called to take each reading, left_sensor.get_ambient_light by default. The last letter is
+    translated when the task is stopped.
+    """
+    init_hardware()
+
+    if read is None:
+        read = left_sensor.get_ambient_light
 
+    period = 1000 / sample_rate     # Milliseconds between readings
+    start = ticks_ms()
 
-def read_morse_with_pauses(num_readings, min_light, max_light):
+    try:
+        while True:
+            receiver.add(ticks_diff(ticks_ms(), start), read())
+            yield period
+    finally:
+        receiver.finish(ticks_diff(ticks_ms(), start))
+
+
+def show_message_task(receiver, rate=10):
+    """
+    Task for a TaskRunner that shows each letter on the light matrix as soon as receiver, a MorseReceiver, translates it. The message is
+    checked rate times a second.
+    """
+    init_hardware()
+
+    shown = 0   # How much of the message has been shown so far
+
+    while True:
+        for letter in receiver.message[shown:]:
+            if letter != " ":
+                hub.light_matrix.write(letter)
+        shown = len(receiver.message)
+
+        yield 1000 / rate
+
+
+def follow_and_listen(duration, min_light, max_light, dot_length=0.1, sample_rate=None, control_rate=50):
+    """
+    Follow a light for duration seconds while reading morse code flashed by the same light, showing each letter on the light matrix as it is
+    translated. Following the light and showing the letters are separate tasks with their own rates on one TaskRunner. If sample_rate is None,
+    the readings taken to follow the light are also used to read the morse code. Otherwise the morse code is read by its own task at
+    sample_rate, which reads the left sensor again but can sample faster than the wheels are updated. Returns the translated message.
+    """
+    receiver = MorseReceiver(min_light, max_light, dot_length)
+
+    runner = TaskRunner()
+    if sample_rate is None:
+        runner.add(follow_light_task(max_light, control_rate, receiver=receiver))
+    else:
+        runner.add(follow_light_task(max_light, control_rate))
+        runner.add(receive_morse_task(receiver, sample_rate))
+    runner.add(show_message_task(receiver))
+    runner.run(duration)
+
+    return receiver.message.strip(" ")
+
+
+def read_morse_with_pauses(num_readings, min_light, max_light, adapt_rate=0):
     """
     Read in ambient light values from the left sensor num_readings times. Before each reading, the robot will beep once. When the robot beeps,
     press the right button to take a reading. After num_readings readings have been taken, figure out how long the light was on/off and store
     the lengths in a list. For every reading the light is off, there will be a 0 in the list. If the light is on for three readings in a row, 
     then off for three, then on for another, the list will look like [3, 0, 0, 0, 1].
+
+    If adapt_rate is more than 0, the on and off light levels start at max_light and min_light but follow the readings as the room's light
+    changes (see AdaptiveThreshold).
+    """
+    readings = take_readings(num_readings)
+    light_states = classify_readings(readings, min_light, max_light, adapt_rate)
+    morse_lengths = list(get_morse_lengths(light_states))
+
+    morse_lengths = trim_morse_list(morse_lengths)  # Get rid of any trailing 0's
+    
+    return morse_lengths
+
+
+def stream_morse(num_readings, min_light, max_light, adapt_rate=0):
+    """
+    Read morse code the same way as read_morse_with_pauses, but translate it while it is being read. Each letter is yielded as soon as the
+    space after it has been read instead of after all num_readings readings have been taken.
+    """
+    readings = take_readings(num_readings)
+    light_states = classify_readings(readings, min_light, max_light, adapt_rate)
+    morse_lengths = get_morse_lengths(light_states)
+
+    for letter in decode_morse_lengths(morse_lengths):
+        yield letter
+
+
+def read_morse_timed(duration, min_light, max_light, sample_rate=50, dot_length=None, adapt_rate=0, read=None):
+    """
+    Read in ambient light values from the left sensor sample_rate times a second for duration seconds without waiting for any button presses.
+    Each time the light turns on or off, figure out how long it was on/off and convert that time into morse code units, where one unit is
+    dot_length seconds (at W words per minute, a dot is 1.2 / W seconds long). The lengths are stored in a list in the same form as
+    read_morse_with_pauses, so a 0.3 second flash followed by 0.3 seconds of darkness and a 0.1 second flash gives [3, 0, 0, 0, 1].
+    If dot_length is None, it is figured out from the message with estimate_unit, so the sender can send at any speed.
+    adapt_rate works the same way as in read_morse_with_pauses, and read is passed to sample_light to read something other than the left sensor.
+    """
+    samples = sample_light(duration, sample_rate, read)
+    light_durations = list(get_light_durations(samples, min_light, max_light, adapt_rate))
+
+    if dot_length is None:
+        dot_time = estimate_unit(light_durations)
+        if dot_time is None:
+            return []   # The light never turned on, so there is no message
+        dot_length = dot_time / 1000
+
+    morse_lengths = list(get_timed_morse_lengths(light_durations, dot_length))
+
+    return trim_morse_list(morse_lengths)   # Get rid of any trailing 0's
+
+
+def stream_morse_timed(duration, min_light, max_light, sample_rate=50, dot_length=0.1, adapt_rate=0, read=None):
+    """
+    Read morse code the same way as read_morse_timed, but translate it while it is being read. Each letter is yielded as soon as the space
+    after it has been read. Letters are translated before the whole message has been seen, so dot_length can't be figured out from the message
+    and has to be given.
+    """
+    samples = sample_light(duration, sample_rate, read)
+    light_durations = get_light_durations(samples, min_light, max_light, adapt_rate)
+    morse_lengths = get_timed_morse_lengths(light_durations, dot_length)
+
+    for letter in decode_morse_lengths(morse_lengths):
+        yield letter
+
+
+def read_morse_fused(duration, fused_light, sample_rate=50, dot_length=None, adapt_rate=0):
     """
-    readings = []   # A list of readings the left sensor will take
-    morse_lengths = []  # A list of how long the light was on in a row to help distinguish between dots and dashes
+    Read morse code the same way as read_morse_timed, but from both color sensors combined by fused_light (a FusedLight). Seeing the light with
+    both sensors makes fewer readings wrong, so the light can flash faster for the same number of mistakes.
+    """
+    return read_morse_timed(duration, fused_light.min_light, fused_light.max_light, sample_rate, dot_length, adapt_rate, fused_light.read)
+
+
+def take_readings(num_readings):
+    """
+    Yields num_readings ambient light values from the left sensor. Before each reading, the robot will beep once. When the robot beeps,
+    press the right button to take a reading.
+    """
+    init_hardware()
+
     counter = 0     # Counter to help keep track of how many readings it has taken so far
 
     # Take num_readings readings
@@ -152,74 +834,497 @@ def read_morse_with_pauses(num_readings, min_light, max_light):
         hub.speaker.beep()
         hub.right_button.wait_until_pressed()
 
-        # Take a reading from the left sensor and add the reading to the list of readings
-        reading = left_sensor.get_ambient_light()
-        readings.append(reading)
+        # Take a reading from the left sensor and pass it on
+        yield left_sensor.get_ambient_light()
 
         counter += 1    # Increment the counter by 1 to keep track of how many readings it has taken so far
 
-    morse_length = 0    # How many readings in a row the light was detected to be on
 
-    # For each reading, find out if the light was on. If it was, increment morse_length. If it wasn't, add the current value of morse_length
-    # to the morse_lengths list. If morse_length is > 0 and the light is off, also append a 0 to morse_lengths and reset morse_length to 0.
+def sample_light(duration, sample_rate, read=None):
+    """
+    Yields (time, reading) pairs of ambient light values from the left sensor taken sample_rate times a second for duration seconds. The time
+    is in milliseconds since the first reading. Readings are scheduled from the start time rather than from the previous reading, so time spent
+    reading the sensor or handling a reading doesn't make the readings drift later and later. read is the function called to take each
+    reading, left_sensor.get_ambient_light by default, so other sensors (or a FusedLight's read) can be sampled the same way.
+    """
+    init_hardware()
+
+    if read is None:
+        read = left_sensor.get_ambient_light
+
+    period = 1000 / sample_rate     # Milliseconds between readings
+    start = ticks_ms()
+    counter = 0     # Counter to help keep track of how many readings it has taken so far
+
+    while ticks_diff(ticks_ms(), start) < duration * 1000:
+        yield (ticks_diff(ticks_ms(), start), read())
+
+        # Wait until the next reading is due. If the last reading ran late, take the next one right away.
+        counter += 1
+        wait_until(start, counter * period)
+
+
+class FusedLight:
+    """
+    Reads both color sensors and combines them into one reading, so a flashlight shining on the robot is seen by twice as many readings and a
+    bit of noise on one sensor is less likely to flip a dot or a space. Each sensor's reading is first rescaled with its own calibration
+    (left_levels and right_levels are (max_light, min_light) tuples, like calibrate_sensors returns) so that 0 is that sensor's off level and 100
+    is its on level. The rescaled readings are then combined with method:
+
+        "average"   the average of the two, which evens out noise that the sensors don't share
+        "max"       the brighter of the two, for when the light may only be pointed at one sensor
+        "vote"      the reading of whichever sensor is more sure, meaning further from halfway between its off and on levels
+
+    Fused readings are compared against min_light and max_light (0 and 100) instead of a single sensor's calibration.
+    """
+
+    min_light = 0
+    max_light = 100
+
+    def __init__(self, left_levels, right_levels, method="average"):
+        if method not in ("average", "max", "vote"):
+            raise ValueError("unknown fusion method: %s" % method)
+
+        self.left_levels = left_levels
+        self.right_levels = right_levels
+        self.method = method
+
+    def read(self):
+        init_hardware()
+
+        left = rescale_reading(left_sensor.get_ambient_light(), self.left_levels)
+        right = rescale_reading(right_sensor.get_ambient_light(), self.right_levels)
+        return fuse_readings(left, right, self.method)
+
+
+def rescale_reading(reading, levels):
+    """
+    Rescales a reading so that the off level of levels (a (max_light, min_light) tuple) is 0 and the on level is 100. If both levels are the
+    same, readings at or above them are 100 and readings below are 0.
+    """
+    max_light, min_light = levels
+    if max_light == min_light:
+        return 100 if reading >= max_light else 0
+    return (reading - min_light) * 100 / (max_light - min_light)
+
+
+def fuse_readings(left, right, method):
+    """
+    Combines two rescaled readings with one of the FusedLight methods.
+    """
+    if method == "average":
+        return (left + right) / 2
+    if method == "max":
+        return max(left, right)
+
+    # Vote: the sensor whose reading is furthest from halfway is the most sure whether the light is on or off
+    return left if abs(left - 50) >= abs(right - 50) else right
+
+
+class AdaptiveThreshold:
+    """
+    Decides whether readings are on or off while keeping up with slow changes in the room's light, so the robot doesn't have to be calibrated
+    again when the light drifts. It keeps a light level for when the light is on and one for when it is off, starting at max_light and
+    min_light. A reading is on if it is closer to the on level. Each reading then moves the level it was closer to adapt_rate of the way toward
+    it, so both levels follow the light without storing any old readings. The levels are always kept at least min_contrast apart so that a long
+    time with the light on or off can't pull them together.
+    """
+
+    def __init__(self, min_light, max_light, adapt_rate=0.05, min_contrast=10):
+        self.on_level = max_light
+        self.off_level = min_light
+        self.adapt_rate = adapt_rate
+        self.min_contrast = min_contrast
+
+    def is_on(self, reading):
+        # If the reading value is closer to the on level than the off level, the light can be considered to be on
+        light_on = abs(reading - self.on_level) < abs(reading - self.off_level)
+
+        if self.adapt_rate > 0:
+            if light_on:
+                self.on_level += self.adapt_rate * (reading - self.on_level)
+                if self.on_level - self.off_level < self.min_contrast:
+                    self.off_level = self.on_level - self.min_contrast
+            else:
+                self.off_level += self.adapt_rate * (reading - self.off_level)
+                if self.on_level - self.off_level < self.min_contrast:
+                    self.on_level = self.off_level + self.min_contrast
+
+        return light_on
+
+
+def classify_readings(readings, min_light, max_light, adapt_rate=0):
+    """
+    Yields True for each reading where the light is on and False for each reading where it is off. If adapt_rate is more than 0, an
+    AdaptiveThreshold starting at min_light and max_light decides instead.
+    """
+    if adapt_rate > 0:
+        threshold = AdaptiveThreshold(min_light, max_light, adapt_rate)
+        for reading in readings:
+            yield threshold.is_on(reading)
+        return
+
     for reading in readings:
         # If the reading value is closer to max_light than min_light, the light can be considered to be on
-        if abs(reading - max_light) < abs(reading - min_light):
+        yield abs(reading - max_light) < abs(reading - min_light)
+
+
+def get_morse_lengths(light_states):
+    """
+    Yields the morse code lengths for a sequence of on/off light states. Each length is yielded as soon as it is known, so a dot or dash is
+    yielded at the first reading the light is off after it. The states [True, True, True, False, False, False, True] yield 3, 0, 0, 0, 1.
+    """
+    morse_length = 0    # How many readings in a row the light was detected to be on
+
+    # For each reading, find out if the light was on. If it was, increment morse_length. If it wasn't, yield the current value of morse_length.
+    # If morse_length is > 0 and the light is off, also yield a 0 and reset morse_length to 0.
+    for light_on in light_states:
+        if light_on:
             morse_length += 1
         else:
-            morse_lengths.append(morse_length)
+            yield morse_length
             if morse_length > 0:
-                morse_lengths.append(0)
+                yield 0
                 morse_length = 0
 
-    # Make sure all readings were accounted for by checking if morse_length is still > 0 after the loop finishes. If it is, add this value to the list.
+    # Make sure all readings were accounted for by checking if morse_length is still > 0 after the loop finishes. If it is, yield this value.
     if morse_length > 0:
-        morse_lengths.append(morse_length)
+        yield morse_length
 
-    morse_lengths = trim_morse_list(morse_lengths)  # Get rid of any trailing 0's
-    
-    return morse_lengths
 
+def get_light_durations(samples, min_light, max_light, adapt_rate=0):
+    """
+    Yields (light_on, duration) pairs for a sequence of (time, reading) samples, where light_on is whether the light was on and duration is how
+    many milliseconds it stayed that way. A pair is yielded as soon as the light changes, and the last one when the samples run out. Readings
+    are classified by an AdaptiveThreshold, which stays at min_light and max_light if adapt_rate is 0.
+    """
+    threshold = AdaptiveThreshold(min_light, max_light, adapt_rate)
+    light_on = None     # Whether the light is on for the current run of samples, None before the first sample
+    start_time = 0      # Time the current run of samples started
+    last_time = 0       # Time of the most recent sample
+    sample_time = 0     # Time between the two most recent samples
+
+    for time, reading in samples:
+        reading_on = threshold.is_on(reading)
 
-def translate_morse_code(morse_lengths):
+        if light_on is None:
+            light_on = reading_on
+            start_time = time
+        else:
+            sample_time = time - last_time
+            if reading_on != light_on:
+                yield (light_on, time - start_time)
+                light_on = reading_on
+                start_time = time
+
+        last_time = time
+
+    # The last run lasted until the last sample, plus the time that sample covers
+    if light_on is not None:
+        yield (light_on, last_time - start_time + sample_time)
+
+
+def get_timed_morse_lengths(light_durations, dot_length):
     """
-    Given a list of morse code lengths (ex. [3, 0, 0, 0, 1]), separate each letter. Spaces between letters are three units. Three 0's in a row in the list
-    represents a space between letters. One 0 represents a space between dots/dashes of the same letter. Using the example [3, 0, 0, 0, 1], a 2D list
-    [[3], [1]] will be formed. This 2D list will be translated into text using the get_word_string function.
+    Yields the morse code lengths for a sequence of (light_on, duration) pairs, where durations are in milliseconds and a dot is dot_length
+    seconds long. See get_unit_morse_lengths.
     """
-    letters = []    # List where morse code of each letter will be stored, each in their own list
+    for length in get_unit_morse_lengths(light_durations, dot_length * 1000):
+        yield length
 
-    break_time = 0  # Length of the space between dots and dashes
-    curr_letter = []    # List to store the current letter's morse code
-    last_index = len(morse_lengths) - 1     # Last index of the morse_lengths list
 
-    # Separate letters in the morse code lengths into their own lists and put each letter's list into the letters list
-    for i in range(len(morse_lengths)):
-        curr_length = morse_lengths[i]
-        # If i is the last index of the list, just set next_length to 0 to not get an out of bounds error
-        if i < last_index:
-            next_length = morse_lengths[i+1]
+def get_unit_morse_lengths(light_durations, unit):
+    """
+    Yields the morse code lengths for a sequence of (light_on, duration) pairs, where a dot lasts unit (in the same units as the durations).
+    Each pair is classified by classify_light_runs and becomes a 1 (dot) or 3 (dash), or one, three, or seven 0's for a space between dots/dashes,
+    letters, or words. The pairs (True, 300), (False, 300), (True, 100) with a unit of 100 yield 3, 0, 0, 0, 1.
+    """
+    for kind, confidence in classify_light_runs(light_durations, unit):
+        if kind == "dot":
+            yield 1
+        elif kind == "dash":
+            yield 3
         else:
-            next_length = 0
-
-        # If the current length is not 0, but the next length is, append both lengths to the current letter's list and reset break time to 0
-        # Otherwise, if the current length is 0, increment the break time
-        if curr_length != 0 and next_length == 0:
-            curr_letter.append(curr_length)
-            curr_letter.append(next_length)
-            break_time = 0
-        elif curr_length == 0:
-            break_time += 1
-        
-        # If the break time is 3 or i is the last index, we have reached the end of a letter
-        if break_time == 3 or i == last_index:
-            # If the current letter list is not empty, append the current list to the letters list and reset the current list
-            if curr_letter:
-                curr_letter.pop()   # Remove last 0 from list as it is not necessary for translation
-                letters.append(curr_letter)
-                curr_letter = []
+            for i in range(gap_units[kind]):
+                yield 0
+
+
+def classify_light_runs(light_durations, unit=1):
+    """
+    Yields a (kind, confidence) pair for each (light_on, duration) pair, where a dot lasts unit (in the same units as the durations) and
+    confidence goes from 0 for a guess to 1 for a sure decision. Times the light was on are a "dot" or "dash", whichever of 1 and 3 units is
+    closer. Times the light was off are a "space" between dots/dashes if they are shorter than 2 units, a "letter" space if they are shorter than
+    5 units, and a "word" space otherwise, which are the halfway points between 1, 3, and 7 units. This way a dash that lasts 2 or 4 readings
+    is still a dash instead of making its letter impossible to translate.
+    """
+    for light_on, duration in light_durations:
+        units = duration / unit
 
-    return get_word_string(letters)
+        if light_on:
+            # Confidence is how much closer the length is to the chosen kind of mark than the other kind
+            dot_distance = abs(units - 1)
+            dash_distance = abs(units - 3)
+            if dot_distance < dash_distance:
+                yield ("dot", 1 - dot_distance / dash_distance)
+            else:
+                yield ("dash", 1 - dash_distance / dot_distance)
+        else:
+            # Confidence is how far the length is from the nearest threshold compared to how far the kind's usual length is from it
+            if units < 2:
+                yield ("space", min(1, 2 - units))
+            elif units < 5:
+                yield ("letter", min(1, units - 2, 5 - units))
+            else:
+                yield ("word", min(1, (units - 5) / 2))
+
+
+def estimate_unit(light_durations):
+    """
+    Figures out how long one morse code unit (the length of a dot) is from a list of (light_on, duration) pairs, and returns it in the same
+    units as the durations, or None if the light was never on for any time. Pairs with no duration, like a run that only lasted for the one
+    reading taken, are ignored. The times the light was on are split into dots and dashes by repeatedly putting each one in the group whose
+    average it is closer to (two-means clustering). Dashes are three units, so the unit is the average of the dot times and a third of the dash
+    times. If every time is about the same, they are all dots or all dashes, and they are compared with the shortest times the light was off,
+    which are the one unit spaces inside letters.
+    """
+    marks = sorted(duration for light_on, duration in light_durations if light_on and duration > 0)
+    gaps = sorted(duration for light_on, duration in light_durations if not light_on and duration > 0)
+    if not marks:
+        return None
+
+    dots = marks
+    dashes = []
+    short_mean = marks[0]
+    long_mean = marks[-1]
+
+    # Move the split between dots and dashes until neither group changes
+    for i in range(20):
+        split = (short_mean + long_mean) / 2
+        new_dots = [duration for duration in marks if duration <= split]
+        new_dashes = [duration for duration in marks if duration > split]
+        if not new_dashes or (len(new_dots) == len(dots) and i > 0):
+            break
+        dots = new_dots
+        dashes = new_dashes
+        short_mean = sum(dots) / len(dots)
+        long_mean = sum(dashes) / len(dashes)
+
+    # A dash is three times as long as a dot, so groups less than twice as far apart are really all the same kind of mark
+    if not dashes or long_mean < 2 * short_mean:
+        mark_mean = sum(marks) / len(marks)
+        if gaps:
+            short_gaps = [duration for duration in gaps if duration < 2 * gaps[0]]
+            gap_mean = sum(short_gaps) / len(short_gaps)
+            if mark_mean > 2 * gap_mean:
+                return mark_mean / 3
+        return mark_mean
+
+    return (sum(dots) + sum(dashes) / 3) / len(marks)
+
+
+def get_light_runs(morse_lengths):
+    """
+    Turns a morse code lengths list into (light_on, length) pairs, so [3, 0, 0, 0, 1] becomes (True, 3), (False, 3), (True, 1).
+    """
+    runs = []
+    for length in morse_lengths:
+        if length != 0:
+            runs.append((True, length))
+        elif runs and not runs[-1][0]:
+            runs[-1] = (False, runs[-1][1] + 1)
+        else:
+            runs.append((False, 1))
+    return runs
+
+
+def normalize_morse_lengths(morse_lengths):
+    """
+    Rescales a morse code lengths list from read_morse_with_pauses so that a dot is 1 reading long, for when the sender's dots didn't last
+    exactly one reading. The length of a dot is figured out with estimate_unit, so [6, 0, 0, 0, 0, 0, 0, 2] becomes [3, 0, 0, 0, 1].
+    """
+    runs = get_light_runs(morse_lengths)
+    unit = estimate_unit(runs)
+    if unit is None:
+        return []
+
+    return trim_morse_list(list(get_unit_morse_lengths(runs, unit)))
+
+
+def decode_morse_lengths(morse_lengths):
+    """
+    Yields each letter of the morse code lengths as soon as the space after it is seen, and a " " at the end of each word. Letters that don't
+    match any morse code are skipped.
+    """
+    decoder = MorseDecoder()
+
+    for length in morse_lengths:
+        letter = decoder.add(length)
+        if letter:
+            yield letter
+
+    # The last letter doesn't have a space after it, so end it once the lengths are finished
+    letter = decoder.end_letter()
+    if letter:
+        yield letter
+
+
+def build_morse_tree(code_table):
+    """
+    Builds a tree out of a morse code dictionary. Each node is a list [letter, children] where letter is the letter that ends at that node
+    (or None if no letter does) and children is a dictionary from a dot/dash length (1 or 3) to the next node. The dictionary
+    {"E": [1], "I": [1, 0, 1]} builds the tree [None, {1: ["E", {1: ["I", {}]}]}].
+    """
+    root = [None, {}]
+
+    # Walk down the tree one dot/dash at a time for each letter, adding nodes that don't exist yet, and store the letter at the last node
+    for letter, code in code_table.items():
+        node = root
+        for length in code:
+            # 0's are only the spaces between dots/dashes, so they don't move through the tree
+            if length != 0:
+                node = node[1].setdefault(length, [None, {}])
+        node[0] = letter
+
+    return root
+
+
+# Tree of the morse_code dictionary used by MorseDecoder
+morse_tree = build_morse_tree(morse_code)
+
+
+class MorseDecoder:
+    """
+    Translates morse code one length at a time instead of collecting a whole letter and matching it afterwards. Lengths are given in the
+    same form as the morse code lengths list (ex. [3, 0, 0, 0, 1]). Each dot/dash moves one step down the morse code tree, and a letter
+    is returned as soon as the third 0 after it is seen. A space is returned at the seventh 0, which is the end of a word, as long as at least
+    one letter was translated since the last space.
+    """
+
+    def __init__(self, tree=morse_tree):
+        self.tree = tree
+        self.node = tree        # Node of the tree for the dots/dashes seen so far in the current letter, None if they don't match a letter
+        self.break_time = 0     # Number of 0's in a row since the last dot/dash
+        self.in_letter = False  # Whether any dots/dashes have been seen since the last letter ended
+        self.in_word = False    # Whether any letters have been translated since the last space
+
+    def add(self, length):
+        """
+        Adds the next length to the decoder. Returns the translated letter if this length ends a letter, "" if the letter that ended doesn't
+        match any morse code, " " if this length ends a word, or None if nothing ended.
+        """
+        # A dot/dash moves down the tree. If there is no node for it, the current letter can't be translated.
+        if length != 0:
+            if self.node is not None:
+                self.node = self.node[1].get(length)
+            self.in_letter = True
+            self.break_time = 0
+            return None
+
+        self.break_time += 1
+
+        if self.break_time == letter_gap:
+            return self.end_letter()
+
+        if self.break_time == word_gap and self.in_word:
+            self.in_word = False
+            return " "
+        return None
+
+    def end_letter(self):
+        """
+        Ends the current letter and resets the decoder for the next one. Returns the translated letter, "" if the letter doesn't match any
+        morse code, or None if there was no letter to end.
+        """
+        if not self.in_letter:
+            return None
+
+        letter = ""
+        if self.node is not None and self.node[0] is not None:
+            letter = self.node[0]
+
+        self.node = self.tree
+        self.in_letter = False
+        if letter:
+            self.in_word = True
+        return letter
+
+
+class MorseReceiver:
+    """
+    Translates morse code one reading at a time as the readings are taken, for loops that can't stop to wait for a whole message, like a
+    TaskRunner task or a loop that reads the sensors for something else too. Readings are classified with an AdaptiveThreshold, and each time
+    the light turns on or off, how long it was on or off is turned into morse code lengths (see get_timed_morse_lengths) where a dot is
+    dot_length seconds long, and passed to a MorseDecoder. Everything translated so far is kept in message.
+    """
+
+    def __init__(self, min_light, max_light, dot_length=0.1, adapt_rate=0):
+        self.threshold = AdaptiveThreshold(min_light, max_light, adapt_rate)
+        self.decoder = MorseDecoder()
+        self.dot_length = dot_length
+        self.light_on = None    # Whether the light is on for the current run of readings, None before the first reading
+        self.start_time = 0     # Time the current run of readings started
+        self.message = ""
+
+    def add(self, time, reading):
+        """
+        Adds a reading taken at time milliseconds. Returns the letter or space translated because of it, or "" if nothing was translated.
+        """
+        reading_on = self.threshold.is_on(reading)
+
+        if self.light_on is None:
+            self.light_on = reading_on
+            self.start_time = time
+            return ""
+
+        if reading_on == self.light_on:
+            return ""
+
+        text = self.decode_run(self.light_on, time - self.start_time)
+        self.light_on = reading_on
+        self.start_time = time
+        return text
+
+    def finish(self, time):
+        """
+        Translates the last letter once there are no more readings, where time is when the readings stopped. Returns the letter, or "" if
+        there wasn't one.
+        """
+        text = ""
+        if self.light_on:
+            text = self.decode_run(True, time - self.start_time)
+        self.light_on = None
+
+        letter = self.decoder.end_letter()
+        if letter:
+            self.message += letter
+            text += letter
+        return text
+
+    def decode_run(self, light_on, duration):
+        text = ""
+        for length in get_timed_morse_lengths([(light_on, duration)], self.dot_length):
+            letter = self.decoder.add(length)
+            if letter:
+                text += letter
+
+        self.message += text
+        return text
+
+
+def translate_morse_code(morse_lengths, tolerant=False):
+    """
+    Given a list of morse code lengths (ex. [3, 0, 0, 0, 1]), translate it into text. Spaces between letters are three units and spaces between
+    words are seven units. Three 0's in a row in the list represents a space between letters, and seven represents a space between words. One 0
+    represents a space between dots/dashes of the same letter. Each length is passed to a MorseDecoder by decode_morse_lengths, so using the
+    example [3, 0, 0, 0, 1], "T" is translated when the third 0 is reached and "E" when the list ends.
+
+    If tolerant is True, the lengths are first classified with classify_light_runs, so dots, dashes, and spaces that are a little too long or
+    too short are treated as the closest kind instead of making the letter impossible to translate. [2, 0, 0, 0, 0, 1] becomes "TE".
+    """
+    if tolerant:
+        morse_lengths = get_unit_morse_lengths(get_light_runs(morse_lengths), 1)
+
+    return "".join(decode_morse_lengths(morse_lengths)).rstrip(" ")
 
 
 def get_word_string(letters):
@@ -229,14 +1334,130 @@ def get_word_string(letters):
     """
     word = ""
 
-    # Match the morse code list for each letter to the dictionary of translations to find the letter it corresponds to and add it to the word string
-    for i in range(len(letters)):
-        for key, value in morse_code.items():
-            if letters[i] == value:
-                word += key
+    # Look up the morse code list for each letter in the reverse dictionary to find the letter it corresponds to and add it to the word string.
+    # Letters that don't match any morse code are skipped.
+    for letter in letters:
+        word += morse_lookup.get(tuple(letter), "")
     return word
 
 
+def encode_text(text):
+    """
+    Translates text into a list of morse code lengths in the same form as read_morse_with_pauses, the opposite of translate_morse_code. "TE"
+    becomes [3, 0, 0, 0, 1]. Letters are separated by three 0's and words by seven. Characters that aren't in morse_code are skipped.
+    """
+    morse_lengths = []
+
+    for word in text.upper().split():
+        codes = [morse_code[character] for character in word if character in morse_code]
+        if not codes:
+            continue
+
+        if morse_lengths:
+            morse_lengths.extend([0] * word_gap)
+        for i, code in enumerate(codes):
+            if i > 0:
+                morse_lengths.extend([0] * letter_gap)
+            morse_lengths.extend(code)
+
+    return morse_lengths
+
+
+def build_schedule(morse_lengths, dot_length):
+    """
+    Turns a list of morse code lengths into a list of (on time, off time) pairs, one for each dot or dash, where the times are in milliseconds
+    from the start of the message and a dot is dot_length seconds long. Every time is worked out from the start of the message before anything
+    is sent, so [3, 0, 1] with a dot_length of 0.1 gives [(0, 300), (400, 500)].
+    """
+    schedule = []
+    units = 0   # Units from the start of the message to the current length
+
+    for length in morse_lengths:
+        if length > 0:
+            schedule.append((int(round(units * dot_length * 1000)), int(round((units + length) * dot_length * 1000))))
+            units += length
+        else:
+            units += 1
+
+    return schedule
+
+
+class PlaybackEngine:
+    """
+    Plays schedules from build_schedule by beeping the speaker at note or by lighting up the whole light matrix (output "speaker" or "light").
+    Every edge, meaning each time a beep or flash starts or stops, is timed from a single start time taken when play is called instead of
+    waiting for a length of time after the last edge, so waiting never adds up over a long message. Telling the hub to start or stop a beep
+    takes time too, and the beep only changes once the command is done, so the engine measures how long each command takes and sends the next
+    one that much early. The measured command time is kept in overhead, starting at the first measurement and then following each new one
+    adapt_rate of the way, and the furthest any edge landed from its time in the last message is kept in max_error. Both are in milliseconds.
+    """
+
+    def __init__(self, output="speaker", note=72, adapt_rate=0.25):
+        if output == "speaker":
+            self.turn_on = lambda: hub.speaker.start_beep(note)
+            self.turn_off = lambda: hub.speaker.stop()
+        elif output == "light":
+            self.turn_on = lambda: hub.light_matrix.show_image('SQUARE')
+            self.turn_off = lambda: hub.light_matrix.off()
+        else:
+            raise ValueError("unknown output: %s" % output)
+
+        self.adapt_rate = adapt_rate
+        self.overhead = None    # Milliseconds a command takes, None until the first command has been measured
+        self.max_error = 0
+
+    def play(self, schedule):
+        init_hardware()
+
+        self.max_error = 0
+        start = ticks_us()
+
+        for on_time, off_time in schedule:
+            self.send(start, on_time, self.turn_on)
+            self.send(start, off_time, self.turn_off)
+
+    def send(self, start, deadline, command):
+        # Send the command early by however long commands have been taking, so that it finishes at deadline milliseconds after start
+        wait_time = deadline - (self.overhead or 0) - ticks_diff(ticks_us(), start) / 1000
+        if wait_time > 0:
+            wait_for_seconds(wait_time / 1000)
+
+        command_start = ticks_us()
+        command()
+        command_end = ticks_us()
+
+        command_time = ticks_diff(command_end, command_start) / 1000
+        if self.overhead is None:
+            self.overhead = command_time
+        else:
+            self.overhead += self.adapt_rate * (command_time - self.overhead)
+        self.max_error = max(self.max_error, abs(ticks_diff(command_end, start) / 1000 - deadline))
+
+
+def transmit_schedule(schedule, output="speaker", note=72):
+    """
+    Sends a schedule from build_schedule with the speaker or light matrix using a PlaybackEngine, so every beep or flash starts and ends on time
+    no matter how long the message is.
+    """
+    PlaybackEngine(output, note).play(schedule)
+
+
+def transmit_text(text, dot_length=0.1, output="speaker", note=72):
+    """
+    Sends text in morse code with the speaker or light matrix, where a dot is dot_length seconds long. See transmit_schedule.
+    """
+    transmit_schedule(build_schedule(encode_text(text), dot_length), output, note)
+
+
+def wait_until(start, deadline):
+    """
+    Waits until deadline milliseconds after start, a time from ticks_ms. If the deadline has already passed, returns right away.
+    """
+    wait_time = deadline - ticks_diff(ticks_ms(), start)
+    if wait_time > 0:
+        wait_for_seconds(wait_time / 1000)
+
+
 def trim_morse_list(morse_list):
     """
     Gets rid of trailing 0's in the morse code list
@@ -264,6 +1485,8 @@ def demo():
     from the word, it will display a happy face for 5 seconds, repeat the morse code message in beeps, and display the translation on the light 
     matrix. If it cannot translate the word at all, it will display a sad face.
     """
+    init_hardware()
+
     wait_for_seconds(1)
     left_sensor.get_ambient_light()
     right_sensor.get_ambient_light()
@@ -288,17 +1511,15 @@ def demo():
         hub.light_matrix.show_image('HAPPY')
         wait_for_seconds(5)
 
-        for length in morse:
-            if length > 0:
-                hub.speaker.beep(seconds=0.25*length)
-            else:
-                wait_for_seconds(0.25)
+        # Repeat the message with each unit lasting a quarter of a second
+        transmit_schedule(build_schedule(morse, 0.25), note=60)
 
         hub.light_matrix.write(str(message))
     else:
         hub.light_matrix.show_image('SAD')
 
 
-
-
-demo()
+# Only run the demo when this file is run as a program on the robot, so importing it doesn't start the robot.
+# The Spike app starts a program by importing it from the hub's projects folder, so that counts as running it too.
+if __name__ == "__main__" or __name__.startswith("projects"):
+    demo()
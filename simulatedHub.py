@@ -0,0 +1,270 @@
+# Advanced Robotics
+#
+# A simulated Lego Spike hub so the light following and morse code programs can run on a computer without the robot. Time is simulated, so
+# nothing actually waits and a 20 second run finishes as fast as the computer can run it. The light each color sensor sees comes from a
+# light source, which is a function that takes the current simulated time in seconds and returns an ambient light value.
+#
+# Example:
+#     import robotDemo, simulatedHub
+#     sim = simulatedHub.SimulatedBackend(lights={'A': simulatedHub.morse_light([1, 0, 3], 0.1)})
+#     robotDemo.use_backend(sim)
+#     robotDemo.read_morse_timed(1, 5, 90)
+
+from bisect import bisect_right
+
+
+class SimulatedClock:
+    """
+    Keeps track of the simulated time in seconds. Time only moves forward when something waits or takes time, like reading a sensor.
+    """
+
+    def __init__(self):
+        self.time = 0.0
+
+    def now(self):
+        return self.time
+
+    def advance(self, seconds):
+        if seconds > 0:
+            self.time += seconds
+
+
+class SimulatedTimer:
+    """
+    Simulated spike.control.Timer. Like the real timer, now() returns the number of whole seconds since the timer was last reset.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.start = clock.now()
+
+    def reset(self):
+        self.start = self.clock.now()
+
+    def now(self):
+        return int(self.clock.now() - self.start)
+
+
+class SimulatedSpeaker:
+    """
+    Simulated hub speaker. Each beep is recorded as a (start time, note, seconds) tuple in beeps and takes as long as the beep lasts. Starting
+    or stopping a beep takes command_time seconds, and the sound only changes once the command is done.
+    """
+
+    def __init__(self, clock, command_time=0):
+        self.clock = clock
+        self.command_time = command_time
+        self.beeps = []
+        self.beep_start = None  # Time and note of a beep started with start_beep that hasn't been stopped yet
+
+    def beep(self, note=60, seconds=0.2):
+        self.clock.advance(self.command_time)
+        self.beeps.append((self.clock.now(), note, seconds))
+        self.clock.advance(seconds)
+
+    def start_beep(self, note=60):
+        self.stop()
+        self.beep_start = (self.clock.now(), note)
+
+    def stop(self):
+        self.clock.advance(self.command_time)
+        if self.beep_start is not None:
+            start, note = self.beep_start
+            self.beeps.append((start, note, self.clock.now() - start))
+            self.beep_start = None
+
+
+class SimulatedButton:
+    """
+    Simulated hub button. Waiting for a press takes press_time seconds, as if someone pressed it right away.
+    """
+
+    def __init__(self, clock, press_time):
+        self.clock = clock
+        self.press_time = press_time
+        self.presses = 0
+
+    def wait_until_pressed(self):
+        self.clock.advance(self.press_time)
+        self.presses += 1
+
+
+class SimulatedLightMatrix:
+    """
+    Simulated hub light matrix. Everything shown on it is recorded in shown, images by name and text as it was written, and None each time it is
+    turned off.
+    """
+
+    def __init__(self):
+        self.shown = []
+
+    def show_image(self, image, brightness=100):
+        self.shown.append(image)
+
+    def write(self, text):
+        self.shown.append(str(text))
+
+    def off(self):
+        self.shown.append(None)
+
+
+class SimulatedPrimeHub:
+    """
+    Simulated spike.PrimeHub with a speaker, left and right buttons, and a light matrix. Speaker commands take command_time seconds.
+    """
+
+    def __init__(self, clock, press_time, command_time=0):
+        self.speaker = SimulatedSpeaker(clock, command_time)
+        self.left_button = SimulatedButton(clock, press_time)
+        self.right_button = SimulatedButton(clock, press_time)
+        self.light_matrix = SimulatedLightMatrix()
+
+
+class SimulatedColorSensor:
+    """
+    Simulated spike.ColorSensor. The ambient light is read from the light source at the current simulated time and limited to 0-100 like the
+    real sensor. Each reading takes read_time seconds.
+    """
+
+    def __init__(self, clock, light, read_time):
+        self.clock = clock
+        self.light = light
+        self.read_time = read_time
+        self.readings = 0
+
+    def get_ambient_light(self):
+        reading = int(round(self.light(self.clock.now())))
+        self.clock.advance(self.read_time)
+        self.readings += 1
+        return max(0, min(100, reading))
+
+
+class SimulatedMotor:
+    """
+    Simulated spike.Motor. The motor keeps track of how far it has turned in degrees, turning max_speed degrees per second at 100% speed.
+    Each command takes command_time seconds and is counted in commands.
+    """
+
+    def __init__(self, clock, command_time, max_speed=1000):
+        self.clock = clock
+        self.command_time = command_time
+        self.max_speed = max_speed
+        self.speed = 0
+        self.position = 0.0
+        self.commands = 0
+        self.last_update = clock.now()
+
+    def update(self):
+        """
+        Turn the motor by however far it would have turned at its current speed since it was last updated.
+        """
+        now = self.clock.now()
+        self.position += self.speed / 100 * self.max_speed * (now - self.last_update)
+        self.last_update = now
+
+    def start(self, speed=75):
+        self.update()
+        self.speed = max(-100, min(100, speed))
+        self.commands += 1
+        self.clock.advance(self.command_time)
+
+    def stop(self):
+        self.update()
+        self.speed = 0
+        self.commands += 1
+        self.clock.advance(self.command_time)
+
+    def get_position(self):
+        self.update()
+        return self.position
+
+
+class SimulatedBackend:
+    """
+    Backend for robotDemo.use_backend that runs on simulated time. lights is a dictionary from a color sensor port to its light source, and
+    sensors without a light source see a constant light of 0. Sensor readings take read_time seconds, motor and speaker commands take
+    command_time seconds, and button presses take press_time seconds. The created hub, sensors, and motors are kept in hub, sensors, and motors
+    so they can be checked after a run.
+    """
+
+    def __init__(self, lights=None, read_time=0.002, command_time=0.001, press_time=0.05):
+        self.clock = SimulatedClock()
+        self.lights = lights or {}
+        self.read_time = read_time
+        self.command_time = command_time
+        self.press_time = press_time
+        self.hub = None
+        self.sensors = {}
+        self.motors = {}
+
+    def PrimeHub(self):
+        self.hub = SimulatedPrimeHub(self.clock, self.press_time, self.command_time)
+        return self.hub
+
+    def ColorSensor(self, port):
+        sensor = SimulatedColorSensor(self.clock, self.lights.get(port, constant_light(0)), self.read_time)
+        self.sensors[port] = sensor
+        return sensor
+
+    def Motor(self, port):
+        motor = SimulatedMotor(self.clock, self.command_time)
+        self.motors[port] = motor
+        return motor
+
+    def Timer(self):
+        return SimulatedTimer(self.clock)
+
+    def wait_for_seconds(self, seconds):
+        self.clock.advance(seconds)
+
+    def ticks_ms(self):
+        return int(self.clock.now() * 1000)
+
+    def ticks_us(self):
+        return int(self.clock.now() * 1000000)
+
+    def ticks_diff(self, end, start):
+        return end - start
+
+
+def constant_light(level):
+    """
+    Light source that is always level.
+    """
+    return lambda time: level
+
+
+def morse_light(morse_lengths, unit, on=90, off=5, start=0):
+    """
+    Light source that flashes a morse code lengths list (ex. [3, 0, 0, 0, 1]) starting at start seconds. Each unit lasts unit seconds, so a
+    length of 3 is a flash 3 units long and each 0 is one unit of darkness. The light is off before and after the message.
+    """
+    # Times when each flash starts and ends, in order
+    flash_starts = []
+    flash_ends = []
+    time = start
+    for length in morse_lengths:
+        if length > 0:
+            flash_starts.append(time)
+            flash_ends.append(time + length * unit)
+            time += length * unit
+        else:
+            time += unit
+
+    def light(now):
+        # Find the last flash that started at or before now and check if it is still on
+        i = bisect_right(flash_starts, now) - 1
+        if i >= 0 and now < flash_ends[i]:
+            return on
+        return off
+
+    return light
+
+
+def reading_light(readings):
+    """
+    Light source that gives the next value of readings each time a sensor reads it, no matter what time it is, and 0 once they run out.
+    This makes it easy to script read_morse_with_pauses, which takes one reading per button press.
+    """
+    readings = iter(readings)
+    return lambda time: next(readings, 0)